@@ -4,8 +4,10 @@ import xbmcgui
 import xbmcaddon
 import xbmcvfs
 import os
+import sys
 import shutil
 import tempfile
+import threading
 import traceback
 
 from resources.lib.utils import (
@@ -24,9 +26,13 @@ from resources.lib.repo_installer import (
 )
 from resources.lib.update_checker import check_for_updates
 from resources.lib.first_run import show_intro_message_once
-from resources.lib.qr_generator import generate_qr_code
-from resources.lib.icon_utils import normalize_folder_name, create_icon_folder_if_missing
+from resources.lib.qr_generator import generate_qr_code, get_cached_qr, prerender_qr_codes
+from resources.lib.detail_scheduler import DetailPaneScheduler
+from resources.lib.job_queue import JobQueue, check_cancelled, current_job, report_progress
+from resources.lib.icon_utils import get_icon_path
 from resources.lib import sources_manager
+from resources.lib import release_index
+from resources.lib import http_client
 
 ADDON        = xbmcaddon.Addon()
 ADDON_ID     = ADDON.getAddonInfo('id')
@@ -45,22 +51,6 @@ FIRST_RUN_FILE  = os.path.join(ADDON_PATH, '.firstrun')
 LAST_ETAG_FILE  = os.path.join(ADDON_PATH, '.last_etag')
 NO_TELEGRAM_IMG = os.path.join(ADDON_PATH, 'resources', 'skins', 'default', 'media', 'no-telegram.png')
 
-# Controllo aggiornamenti all'avvio
-if check_for_updates(
-    ADDON_NAME=ADDON_NAME,
-    ADDON_ICON=ADDON_ICON,
-    LOCAL_JSON=LOCAL_JSON,
-    BACKUP_JSON=BACKUP_JSON,
-    LAST_ETAG_FILE=LAST_ETAG_FILE,
-    REMOTE_URL=REMOTE_URL
-):
-    log(f"{ADDON_NAME}: File addons.json aggiornato")
-else:
-    log(f"{ADDON_NAME}: Nessun aggiornamento disponibile")
-
-# Messaggio introduttivo
-show_intro_message_once(ADDON_NAME, FIRST_RUN_FILE)
-
 class ApiWarningDialog(xbmcgui.WindowXMLDialog):
     """Dialog personalizzato per l'avviso API con QR code integrato"""
     def __init__(self, *args, **kwargs):
@@ -129,12 +119,33 @@ def show_api_warning(repo_name, api_guide_link):
     
     return confirmed
 
+def youtube_channel_options():
+    """Voci Official/Beta con la versione dall'indice delle release (nessuna attesa di rete)"""
+    options = []
+    for label, channel in (("Official", 'youtube_official'), ("Beta", 'youtube_beta')):
+        version = release_index.get_version(channel)
+        suffix = f" [COLOR lime]{version}[/COLOR]" if version else ""
+        options.append(f"Scarica ultima versione {label}{suffix}")
+    return options
+
+def job_progress_callback(verb):
+    """progress_callback per install_all_repos/uninstall_all_repos dentro un lavoro"""
+    def callback(index, total, name):
+        report_progress((index * 100) // max(total, 1), f"{verb}: {name}")
+        job = current_job()
+        return job is not None and job.cancelled
+    return callback
+
 class RepoManagerGUI(xbmcgui.WindowXML):
     def __init__(self, *args, **kwargs):
         super().__init__()
         self.sources = []
         self.selected_index = 0
         self.controls = {}
+        self.detail_scheduler = DetailPaneScheduler(self.update_display, self.update_display_slow)
+        self.jobs = JobQueue(workers=3, progress_callback=self.on_job_progress)
+        self.progress_bg = None
+        self.progress_lock = threading.Lock()
 
     def onInit(self):
         self.controls = {
@@ -148,6 +159,8 @@ class RepoManagerGUI(xbmcgui.WindowXML):
         self.load_data()
         self.populate_list()
         self.setFocusId(100)
+        # Pre-genera in background i QR di tutto il catalogo
+        prerender_qr_codes([s.get('telegram', '') for s in self.sources])
 
     def load_data(self):
         try:
@@ -167,23 +180,8 @@ class RepoManagerGUI(xbmcgui.WindowXML):
             lst.addItem(xbmcgui.ListItem("Nessun repository disponibile"))
             return
 
-        icons_base = os.path.join(ADDON_PATH, 'resources', 'icone')
-        os.makedirs(icons_base, exist_ok=True)
-        default_icon = os.path.join(icons_base, 'default.png')
-
         for repo in self.sources:
-            folder = normalize_folder_name(repo['name'])
-            folder_path = os.path.join(icons_base, folder)
-            create_icon_folder_if_missing(folder_path)
-
-            icon = None
-            if os.path.isdir(folder_path):
-                for f in os.listdir(folder_path):
-                    if f.lower().startswith('icon'):
-                        icon = os.path.join(folder_path, f)
-                        break
-            if not icon and os.path.exists(default_icon):
-                icon = default_icon
+            icon = get_icon_path(repo['name'])
 
             item = xbmcgui.ListItem(repo['name'])
             if icon:
@@ -191,29 +189,53 @@ class RepoManagerGUI(xbmcgui.WindowXML):
             item.setProperty('description', repo.get('description', ''))
             item.setProperty('telegram', repo.get('telegram', ''))
             item.setProperty('api_guide', repo.get('api_guide', ''))
-            
-            # Gestione speciale per Trakt e YouTube
-            repo_name = repo.get('name', '').lower()
-            if repo_name == 'trakt addon repo' or repo_name == 'youtube repo':
-                # Questi non vengono gestiti come sorgenti normali
-                item.setProperty('checked', "false")
-                item.setProperty('action_label', "Installa")
-            else:
-                installed = is_repo_installed(repo)
-                item.setProperty('checked', "true" if installed else "false")
-                item.setProperty('action_label', "Rimuovi" if installed else "Aggiungi")
+            self.set_row_state(item, repo)
 
             lst.addItem(item)
 
         lst.selectItem(0)
         self.selected_index = 0
-        self.update_display()
-
-    def update_display(self):
-        if not self.sources or self.selected_index >= len(self.sources):
+        self.detail_scheduler.schedule(0, immediate=True)
+
+    def set_row_state(self, item, repo):
+        """Imposta le proprietà checked/action_label di una riga"""
+        # Gestione speciale per Trakt e YouTube
+        repo_name = repo.get('name', '').lower()
+        if repo_name == 'trakt addon repo' or repo_name == 'youtube repo':
+            # Questi non vengono gestiti come sorgenti normali
+            checked, action_label = "false", "Installa"
+        else:
+            installed = is_repo_installed(repo)
+            checked = "true" if installed else "false"
+            action_label = "Rimuovi" if installed else "Aggiungi"
+
+        # Tocca il ListItem solo se lo stato è cambiato
+        if item.getProperty('checked') != checked:
+            item.setProperty('checked', checked)
+        if item.getProperty('action_label') != action_label:
+            item.setProperty('action_label', action_label)
+
+    def refresh_rows(self, repos=None):
+        """
+        Aggiorna lo stato delle righe indicate (tutte se repos è None) senza
+        ricostruire la lista: selezione e scroll restano invariati.
+        """
+        lst = self.controls['list']
+        # Confronto per nome: load_data() può aver ricaricato self.sources nel frattempo
+        names = None if repos is None else {r.get('name', '') for r in repos}
+        for index, repo in enumerate(self.sources):
+            if names is not None and repo.get('name', '') not in names:
+                continue
+            if index < lst.size():
+                self.set_row_state(lst.getListItem(index), repo)
+
+    def update_display(self, index=None):
+        """Aggiorna le etichette del pannello dettagli (operazione leggera)"""
+        index = self.selected_index if index is None else index
+        if not self.sources or index >= len(self.sources):
             return
 
-        repo     = self.sources[self.selected_index]
+        repo     = self.sources[index]
         name     = repo.get('name', '')
         desc     = repo.get('description', '')
         tg_link  = repo.get('telegram', '')
@@ -224,8 +246,73 @@ class RepoManagerGUI(xbmcgui.WindowXML):
         self.controls['static_label'].setLabel(title_label)
 
         self.controls['link'].setLabel(tg_link or "Nessun link disponibile")
-        qr_path = generate_qr_code(tg_link, name) if tg_link else NO_TELEGRAM_IMG
-        self.controls['qr'].setImage(qr_path)
+        if not tg_link:
+            self.controls['qr'].setImage(NO_TELEGRAM_IMG)
+        else:
+            # Solo lettura dalla cache: i QR mancanti li genera update_display_slow
+            self.controls['qr'].setImage(get_cached_qr(tg_link) or "")
+
+    def update_display_slow(self, index, is_current):
+        """Genera il QR in background; il risultato è scartato se la selezione è cambiata"""
+        if index >= len(self.sources):
+            return
+        repo = self.sources[index]
+        tg_link = repo.get('telegram', '')
+        if not tg_link:
+            return
+        if get_cached_qr(tg_link):
+            return
+        qr_path = generate_qr_code(tg_link, repo.get('name', ''))
+        if is_current():
+            self.controls['qr'].setImage(qr_path)
+
+    def close(self):
+        self.detail_scheduler.stop()
+        self.jobs.shutdown(cancel=True)
+        super().close()
+
+    def run_job(self, name, func, *args, on_done=None, **kwargs):
+        """Esegue func in background; evita di accodare due volte la stessa operazione"""
+        if self.jobs.is_pending(name):
+            if xbmcgui.Dialog().yesno(
+                ADDON_NAME,
+                f"«{name}» è già in corso.\n\nAnnullare l'operazione?",
+                yeslabel="Annulla operazione",
+                nolabel="Continua"
+            ):
+                self.jobs.cancel(name)
+            return None
+        return self.jobs.submit(name, func, *args, on_done=on_done, **kwargs)
+
+    def cancel_job_dialog(self):
+        """Scelta di un lavoro in corso da annullare (tasto Menu durante le operazioni)"""
+        names = self.jobs.pending_names()
+        if not names:
+            return
+        choice = xbmcgui.Dialog().select("Annulla operazione", names)
+        if choice >= 0:
+            self.jobs.cancel(names[choice])
+            xbmcgui.Dialog().notification(ADDON_NAME, f"Annullamento di «{names[choice]}»...",
+                                          ADDON_ICON, 3000)
+
+    def on_job_progress(self, job, percent, message):
+        """Riporta l'avanzamento dei lavori nella finestra (proprietà + barra in background)"""
+        with self.progress_lock:
+            if job is None:
+                self.setProperty('busy', 'false')
+                self.clearProperty('job_status')
+                if self.progress_bg:
+                    self.progress_bg.close()
+                    self.progress_bg = None
+                return
+
+            status = f"{job.name}: {message}" if message else job.name
+            self.setProperty('busy', 'true')
+            self.setProperty('job_status', status)
+            if self.progress_bg is None:
+                self.progress_bg = xbmcgui.DialogProgressBG()
+                self.progress_bg.create(ADDON_NAME, status)
+            self.progress_bg.update(percent, ADDON_NAME, status)
 
     def onAction(self, action):
         action_id = action.getId()
@@ -233,11 +320,15 @@ class RepoManagerGUI(xbmcgui.WindowXML):
             self.close()
             return
 
+        if action_id == xbmcgui.ACTION_CONTEXT_MENU and self.jobs.busy:
+            self.cancel_job_dialog()
+            return
+
         if self.getFocusId() == 100:
             new_index = self.controls['list'].getSelectedPosition()
             if new_index != self.selected_index and new_index < len(self.sources):
                 self.selected_index = new_index
-                self.update_display()
+                self.detail_scheduler.schedule(new_index)
                 
         # Gestione del tasto Invio
         if action_id == xbmcgui.ACTION_SELECT_ITEM and self.getFocusId() == 100:
@@ -276,37 +367,23 @@ class RepoManagerGUI(xbmcgui.WindowXML):
             
             # Gestione speciale per YouTube
             if name_lower == 'youtube repo' and not is_repo_installed(repo):
-                options = ["Scarica ultima versione Official", "Scarica ultima versione Beta"]
+                options = youtube_channel_options()
                 choice = xbmcgui.Dialog().select("YouTube Addon repo", options)
                 if choice < 0:
                     return
                     
                 log(f"Scelta YouTube: {'Beta' if choice == 1 else 'Official'}", xbmc.LOGINFO)
-                success = install_youtube_addon(use_beta=(choice == 1))
-                
-                if success:
-                    log("Installazione YouTube completata con successo", xbmc.LOGINFO)
-                    if xbmcgui.Dialog().yesno(
-                        ADDON_NAME,
-                        "File di YouTube scaricato con successo! Per completare l'installazione, dopo il riavvio vai in 'Installa da file zip' -> 'YouTube Install'.\n\nRiavviare Kodi ora?",
-                        yeslabel="Sì",
-                        nolabel="No"
-                    ):
-                        xbmc.executebuiltin("RestartApp")
-                    else:
-                        xbmcgui.Dialog().notification(
-                            ADDON_NAME,
-                            "Ricorda di riavviare Kodi per vedere il file zip in 'Installa da file zip'",
-                            ADDON_ICON,
-                            3000
-                        )
-                else:
-                    log("Errore durante l'installazione di YouTube", xbmc.LOGERROR)
+                self.run_job(name, install_youtube_addon, use_beta=(choice == 1),
+                             on_done=self.on_youtube_installed)
                 return
             
             # Gestione speciale per Trakt
             if name_lower == 'trakt addon repo':
-                install_trakt_addon()
+                version = release_index.get_version('trakt')
+                if version:
+                    xbmcgui.Dialog().notification(ADDON_NAME, f"Trakt {version}: download in corso",
+                                                  ADDON_ICON, 3000)
+                self.run_job(name, install_trakt_addon)
                 return
                 
             # Gestione standard per altri repository
@@ -325,15 +402,41 @@ class RepoManagerGUI(xbmcgui.WindowXML):
                 3000
             )
             
+    def on_youtube_installed(self, success):
+        if success:
+            log("Installazione YouTube completata con successo", xbmc.LOGINFO)
+            if xbmcgui.Dialog().yesno(
+                ADDON_NAME,
+                "File di YouTube scaricato con successo! Per completare l'installazione, dopo il riavvio vai in 'Installa da file zip' -> 'YouTube Install'.\n\nRiavviare Kodi ora?",
+                yeslabel="Sì",
+                nolabel="No"
+            ):
+                xbmc.executebuiltin("RestartApp")
+            else:
+                xbmcgui.Dialog().notification(
+                    ADDON_NAME,
+                    "Ricorda di riavviare Kodi per vedere il file zip in 'Installa da file zip'",
+                    ADDON_ICON,
+                    3000
+                )
+        else:
+            log("Errore durante l'installazione di YouTube", xbmc.LOGERROR)
+
     def refresh_list(self):
-        if check_for_updates(
+        self.run_job(
+            "Aggiorna Lista",
+            check_for_updates,
             ADDON_NAME=ADDON_NAME,
             ADDON_ICON=ADDON_ICON,
             LOCAL_JSON=LOCAL_JSON,
             BACKUP_JSON=BACKUP_JSON,
             LAST_ETAG_FILE=LAST_ETAG_FILE,
-            REMOTE_URL=REMOTE_URL
-        ):
+            REMOTE_URL=REMOTE_URL,
+            on_done=self.on_list_refreshed
+        )
+
+    def on_list_refreshed(self, updated):
+        if updated:
             self.load_data()
             self.populate_list()
             xbmcgui.Dialog().notification(
@@ -344,79 +447,68 @@ class RepoManagerGUI(xbmcgui.WindowXML):
             )
 
     def install_all(self):
-        # Separare i repository speciali dagli altri
-        special_repos = []
+        """Raccoglie subito le scelte dell'utente, poi installa tutto in background"""
         standard_repos = []
-        
-        for repo in self.sources:
-            name_lower = repo.get('name', '').lower()
-            if name_lower == 'trakt addon repo' or name_lower == 'youtube repo':
-                special_repos.append(repo)
-            else:
-                standard_repos.append(repo)
+        youtube_beta = None
+        with_trakt = False
+        declined = 0
 
-        def progress_callback(index, total, name):
-            if progress_dialog.iscanceled():
-                return True
-            progress_dialog.update((index * 100) // total, f"Elaborazione: {name}")
-            return False
-
-        progress_dialog = xbmcgui.DialogProgress()
-        progress_dialog.create(ADDON_NAME, "Installazione repository standard...")
-        
-        # Installazione repository standard
-        added_standard, skipped_standard = 0, 0
-        if standard_repos:
-            added_standard, skipped_standard = install_all_repos(
-                standard_repos, 
-                progress_callback=progress_callback
-            )
-        
-        progress_dialog.close()
-        
-        # Gestione API per YouTube e YT Music
-        for repo in standard_repos:
-            name_lower = repo.get('name', '').lower()
-            if ('youtube' in name_lower or 'yt music' in name_lower) and not is_repo_installed(repo):
-                tg_link = repo.get('telegram', '')
-                api_guide = repo.get('api_guide', '')
-                if not show_api_warning(repo['name'], api_guide or tg_link):
-                    # Se l'utente annulla, consideriamo come saltato
-                    skipped_standard += 1
-                    added_standard -= 1
-
-        # Installazione repository speciali
-        added_special = 0
-        for repo in special_repos:
+        for repo in self.sources:
             name_lower = repo.get('name', '').lower()
             tg_link = repo.get('telegram', '')
             api_guide = repo.get('api_guide', '')
-            
+
             if name_lower == 'youtube repo':
                 # Mostra avviso API per YouTube
                 if not show_api_warning(repo['name'], api_guide or tg_link):
                     continue
-                    
-                options = ["Scarica ultima versione Official", "Scarica ultima versione Beta"]
-                choice = xbmcgui.Dialog().select("YouTube Addon repo", options)
+                choice = xbmcgui.Dialog().select("YouTube Addon repo", youtube_channel_options())
                 if choice >= 0:
-                    success = install_youtube_addon(use_beta=(choice == 1))
-                    if success:
-                        added_special += 1
+                    youtube_beta = (choice == 1)
             elif name_lower == 'trakt addon repo':
-                if install_trakt_addon():
-                    added_special += 1
+                with_trakt = True
+            else:
+                # Gestione API per YT Music: se l'utente annulla, la sorgente è saltata
+                if ('youtube' in name_lower or 'yt music' in name_lower) and not is_repo_installed(repo):
+                    if not show_api_warning(repo['name'], api_guide or tg_link):
+                        declined += 1
+                        continue
+                standard_repos.append(repo)
 
-        # Aggiornamento interfaccia
-        self.load_data()
-        self.populate_list()
+        self.run_job("Aggiungi Tutti", self.install_all_job, standard_repos, youtube_beta, with_trakt,
+                     on_done=lambda counts: self.on_all_installed(counts, declined))
+
+    def install_all_job(self, standard_repos, youtube_beta, with_trakt):
+        """Lavoro di "Aggiungi Tutti": sorgenti standard, poi YouTube e Trakt"""
+        try:
+            added_standard, skipped_standard = 0, 0
+            if standard_repos:
+                added_standard, skipped_standard = install_all_repos(
+                    standard_repos,
+                    progress_callback=job_progress_callback("Elaborazione")
+                )
+            check_cancelled()
+
+            added_special = 0
+            if youtube_beta is not None and install_youtube_addon(use_beta=youtube_beta):
+                added_special += 1
+            check_cancelled()
+            if with_trakt and install_trakt_addon():
+                added_special += 1
+            return added_standard, added_special, skipped_standard
+        finally:
+            # Anche se annullato: le sorgenti già aggiunte vanno mostrate
+            self.refresh_rows()
+
+    def on_all_installed(self, counts, declined):
+        added_standard, added_special, skipped_standard = counts
 
         # Messaggio riepilogativo
         message = (
             f"Installazione completata:\n"
             f"[COLOR=lime]{added_standard}[/COLOR] sorgenti standard aggiunte\n"
             f"[COLOR=yellow]{added_special}[/COLOR] sorgenti speciali aggiunte\n"
-            f"[COLOR=grey]{skipped_standard}[/COLOR] sorgenti già presenti"
+            f"[COLOR=grey]{skipped_standard + declined}[/COLOR] sorgenti già presenti"
         )
         
         xbmcgui.Dialog().ok(ADDON_NAME, message)
@@ -447,20 +539,18 @@ class RepoManagerGUI(xbmcgui.WindowXML):
         ):
             return
 
-        def progress_callback(index, total, name):
-            if progress_dialog.iscanceled():
-                return True
-            progress_dialog.update((index * 100) // total, f"Rimozione: {name}")
-            return False
+        self.run_job("Rimuovi Tutti", self.uninstall_all_job, list(self.sources),
+                     on_done=self.on_all_uninstalled)
 
-        progress_dialog = xbmcgui.DialogProgress()
-        progress_dialog.create(ADDON_NAME, "Rimozione in corso...")
+    def uninstall_all_job(self, sources):
+        """Lavoro di "Rimuovi Tutti" """
+        try:
+            return uninstall_all_repos(sources, progress_callback=job_progress_callback("Rimozione"))
+        finally:
+            self.refresh_rows()
 
-        removed, errors = uninstall_all_repos(self.sources, progress_callback=progress_callback)
-        
-        progress_dialog.close()
-        self.load_data()
-        self.populate_list()
+    def on_all_uninstalled(self, counts):
+        removed, errors = counts
 
         if removed > 0 or errors > 0:
             message = (
@@ -491,15 +581,14 @@ class RepoManagerGUI(xbmcgui.WindowXML):
             )
             
     def install_single(self, repo, show_dialog=True):
-        name = repo['name']
-        name_lower = name.lower()
-
-        # Gestione normale per YT Music e altri repository
-        success = install_repo(repo)
+        # Gestione normale per YT Music e altri repository, in background
+        return self.run_job(repo['name'], install_repo, repo,
+                            on_done=lambda success: self.on_installed(repo, success, show_dialog))
 
+    def on_installed(self, repo, success, show_dialog=True):
+        name = repo['name']
         if success:
-            self.load_data()
-            self.populate_list()
+            self.refresh_rows([repo])
             if show_dialog:
                 if xbmcgui.Dialog().yesno(
                     ADDON_NAME,
@@ -538,12 +627,14 @@ class RepoManagerGUI(xbmcgui.WindowXML):
             ):
                 return False
 
-        # Esegui la rimozione
-        success = uninstall_repo(repo)
+        # Esegui la rimozione in background
+        return self.run_job(name, uninstall_repo, repo,
+                            on_done=lambda success: self.on_uninstalled(repo, success, show_dialog))
 
+    def on_uninstalled(self, repo, success, show_dialog=True):
+        name = repo['name']
         if success:
-            self.load_data()
-            self.populate_list()
+            self.refresh_rows([repo])
             if show_dialog:
                 if xbmcgui.Dialog().yesno(
                     ADDON_NAME,
@@ -570,9 +661,42 @@ class RepoManagerGUI(xbmcgui.WindowXML):
         return success
 
 
+def startup_checks():
+    """Controllo aggiornamenti della lista e messaggio introduttivo (solo per la GUI)"""
+    if check_for_updates(
+        ADDON_NAME=ADDON_NAME,
+        ADDON_ICON=ADDON_ICON,
+        LOCAL_JSON=LOCAL_JSON,
+        BACKUP_JSON=BACKUP_JSON,
+        LAST_ETAG_FILE=LAST_ETAG_FILE,
+        REMOTE_URL=REMOTE_URL
+    ):
+        log(f"{ADDON_NAME}: File addons.json aggiornato")
+    else:
+        log(f"{ADDON_NAME}: Nessun aggiornamento disponibile")
+
+    # Messaggio introduttivo
+    show_intro_message_once(ADDON_NAME, FIRST_RUN_FILE)
+
+def rollback_self_update():
+    """Azione dalle impostazioni: torna alla versione precedente all'ultimo aggiornamento"""
+    from resources.lib.github_sync import rollback_update
+    if not xbmcgui.Dialog().yesno(ADDON_NAME, "Ripristinare la versione precedente dell'addon?"):
+        return
+    if rollback_update():
+        xbmcgui.Dialog().ok(ADDON_NAME, "Versione precedente ripristinata.")
+    else:
+        xbmcgui.Dialog().ok(ADDON_NAME, "Nessuna versione precedente disponibile.")
+
+
 if __name__ == "__main__":
-    xbmc.sleep(300)
-    win = RepoManagerGUI("RepoManagerGUI.xml", ADDON_PATH, "default")
-    win.doModal()
-    del win
+    if len(sys.argv) > 1 and sys.argv[1] == 'rollback':
+        rollback_self_update()
+    else:
+        startup_checks()
+        xbmc.sleep(300)
+        win = RepoManagerGUI("RepoManagerGUI.xml", ADDON_PATH, "default")
+        win.doModal()
+        del win
+        http_client.close_all()
 
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+# resources/lib/addon_registry.py
+# Registro degli addon installati, letto con una sola chiamata JSON-RPC
+
+import json
+import threading
+import xbmc
+
+# Fallback per cataloghi che non hanno ancora il campo "addon_id"
+LEGACY_ADDON_IDS = {
+    "kodinerds": "repository.kodinerds",
+    "sandmann": "repository.sandmann79.plugins",
+    "elementum": "repository.elementumorg"
+}
+
+# {addon_id: {'version': str, 'enabled': bool}}, None finché non viene caricato
+_installed = None
+_lock = threading.RLock()
+
+def _fetch_installed_addons():
+    """Legge tutti gli addon installati con versione e stato tramite Addons.GetAddons"""
+    req = {
+        "jsonrpc": "2.0", "method": "Addons.GetAddons",
+        "params": {"installed": True, "properties": ["version", "enabled"]}, "id": 1
+    }
+    try:
+        resp = json.loads(xbmc.executeJSONRPC(json.dumps(req)))
+        addons = resp.get("result", {}).get("addons", [])
+    except Exception as e:
+        xbmc.log(f"[AddonRegistry] Errore Addons.GetAddons: {e}", xbmc.LOGERROR)
+        return {}
+    return {
+        a["addonid"]: {"version": a.get("version", ""), "enabled": a.get("enabled", True)}
+        for a in addons if a.get("addonid")
+    }
+
+def get_installed_addons():
+    """Restituisce il registro, caricandolo alla prima richiesta della sessione"""
+    global _installed
+    with _lock:
+        if _installed is None:
+            _installed = _fetch_installed_addons()
+            xbmc.log(f"[AddonRegistry] {len(_installed)} addon installati", xbmc.LOGINFO)
+        return _installed
+
+def refresh():
+    """Ricarica il registro (da usare dopo un'installazione fatta da noi)"""
+    global _installed
+    with _lock:
+        _installed = None
+        return get_installed_addons()
+
+def mark_removed(addon_id):
+    """
+    Toglie un addon dal registro dopo la rimozione della sua cartella:
+    Kodi continua a elencarlo fino al riavvio.
+    """
+    with _lock:
+        if _installed is not None:
+            _installed.pop(addon_id, None)
+
+def is_addon_installed(addon_id):
+    """Controlla se un addon è installato"""
+    return addon_id in get_installed_addons()
+
+def get_catalog_addon_id(repo):
+    """
+    ID dell'addon associato a una voce del catalogo installata da ZIP
+    (campo "addon_id" di addons.json), None per le semplici sorgenti.
+    """
+    addon_id = repo.get("addon_id")
+    if addon_id:
+        return addon_id
+    name = repo.get("name", "").lower()
+    for key, legacy_id in LEGACY_ADDON_IDS.items():
+        if key in name:
+            return legacy_id
+    return None
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+# resources/lib/detail_scheduler.py
+# Aggiornamento ritardato e asincrono del pannello dettagli della GUI
+
+import threading
+import time
+import xbmc
+from resources.lib.utils import log
+
+class DetailPaneScheduler:
+    """
+    Raggruppa i cambi di selezione ravvicinati e aggiorna il pannello dettagli
+    solo per l'ultimo elemento, dopo un breve tempo di assestamento.
+
+    - render_fast(index): aggiornamento leggero (etichette), eseguito appena
+      la selezione si ferma
+    - render_slow(index, is_current): lavoro lento (QR, metadati) eseguito
+      in un thread separato; is_current() diventa False se nel frattempo
+      la selezione è cambiata e il risultato va scartato
+    """
+
+    def __init__(self, render_fast, render_slow, settle_ms=150):
+        self._render_fast = render_fast
+        self._render_slow = render_slow
+        self._settle = settle_ms / 1000.0
+        self._cond = threading.Condition()
+        self._generation = 0
+        self._pending = None      # (generation, index, deadline)
+        self._slow_job = None     # (generation, index)
+        self._running = True
+        self._threads = [
+            threading.Thread(target=self._settle_loop, name="DetailSettle"),
+            threading.Thread(target=self._slow_loop, name="DetailSlow")
+        ]
+        for t in self._threads:
+            t.daemon = True
+            t.start()
+
+    def schedule(self, index, immediate=False):
+        """Richiede l'aggiornamento del pannello per l'elemento index"""
+        with self._cond:
+            self._generation += 1
+            delay = 0 if immediate else self._settle
+            self._pending = (self._generation, index, time.monotonic() + delay)
+            self._cond.notify_all()
+
+    def stop(self):
+        """Ferma i thread (da chiamare alla chiusura della finestra)"""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+
+    def _is_current(self, generation):
+        return self._running and generation == self._generation
+
+    def _settle_loop(self):
+        while True:
+            with self._cond:
+                while self._running:
+                    if self._pending:
+                        remaining = self._pending[2] - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                    else:
+                        self._cond.wait()
+                if not self._running:
+                    return
+                generation, index, _ = self._pending
+                self._pending = None
+
+            try:
+                self._render_fast(index)
+            except Exception as e:
+                log(f"Errore aggiornamento dettagli: {e}", xbmc.LOGERROR)
+
+            with self._cond:
+                if self._is_current(generation):
+                    self._slow_job = (generation, index)
+                    self._cond.notify_all()
+
+    def _slow_loop(self):
+        while True:
+            with self._cond:
+                while self._running and not self._slow_job:
+                    self._cond.wait()
+                if not self._running:
+                    return
+                generation, index = self._slow_job
+                self._slow_job = None
+
+            if not self._is_current(generation):
+                continue
+            try:
+                self._render_slow(index, lambda: self._is_current(generation))
+            except Exception as e:
+                log(f"Errore aggiornamento dettagli (background): {e}", xbmc.LOGERROR)
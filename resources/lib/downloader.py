@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+# resources/lib/downloader.py
+# Motore di download condiviso: scrittura a blocchi su file .part,
+# ripresa con HTTP Range, velocità/tempo residuo, verifica di dimensione
+# e SHA-256 durante il trasferimento e rename atomico finale
+
+import hashlib
+import http.client
+import os
+import re
+import time
+import urllib.error
+import xbmc
+import xbmcgui
+from resources.lib import http_client
+from resources.lib.job_queue import check_cancelled, current_job, report_progress
+
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+DOWNLOAD_TIMEOUT = 20
+DOWNLOAD_RETRIES = 5
+VERIFY_RETRIES = 2
+RETRY_DELAY_MS = 1000
+PROGRESS_INTERVAL = 0.5
+PART_SUFFIX = ".part"
+
+_CONTENT_RANGE_RE = re.compile(r'bytes\s+\d+-\d+/(\d+)')
+
+class DownloadError(Exception):
+    """Download non riuscito o annullato dall'utente"""
+
+class DownloadIntegrityError(DownloadError):
+    """File scaricato con dimensione o SHA-256 diversi da quelli attesi"""
+
+def _log(message, level=xbmc.LOGINFO):
+    xbmc.log(f"[Downloader] {message}", level)
+
+def format_size(num_bytes):
+    """Dimensione leggibile: 532 KB, 12.4 MB"""
+    if num_bytes < 1024 * 1024:
+        return f"{num_bytes // 1024} KB"
+    return f"{num_bytes / (1024 * 1024):.1f} MB"
+
+def _format_eta(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes:02d}:{seconds:02d}"
+
+class _Progress:
+    """
+    Avanzamento del download: dentro la coda dei lavori va alla barra dei job,
+    altrimenti (se richiesto) a un DialogProgress con possibilità di annullare.
+    """
+
+    def __init__(self, title, show_dialog):
+        self.title = title
+        self.dialog = None
+        if show_dialog and current_job() is None:
+            self.dialog = xbmcgui.DialogProgress()
+            self.dialog.create(title, "Connessione in corso...")
+        self.started = time.monotonic()
+        self.last_update = 0
+        self.session_bytes = 0
+
+    def update(self, done, total, chunk_size):
+        self.session_bytes += chunk_size
+        now = time.monotonic()
+        if now - self.last_update < PROGRESS_INTERVAL and done != total:
+            return
+        self.last_update = now
+
+        speed = self.session_bytes / max(now - self.started, 0.001)
+        message = f"{format_size(done)}"
+        percent = 0
+        if total:
+            percent = int(done * 100 / total)
+            message += f" / {format_size(total)}"
+        message += f" - {format_size(speed)}/s"
+        if total and speed > 0:
+            message += f" - {_format_eta((total - done) / speed)} rimanenti"
+
+        if self.dialog:
+            self.dialog.update(percent, message)
+            if self.dialog.iscanceled():
+                raise DownloadError("Download annullato")
+        else:
+            report_progress(percent, f"{self.title}: {message}")
+        check_cancelled()
+
+    def close(self):
+        if self.dialog:
+            self.dialog.close()
+
+def _load_part_state(url, part_path, state_path):
+    """
+    Stato del download parziale (URL, ETag, Last-Modified, dimensione totale).
+    Un .part lasciato da un altro URL non viene ripreso.
+    """
+    # Import locale: utils importa questo modulo
+    from resources.lib.utils import load_json_state
+    state = load_json_state(state_path, {})
+    if not isinstance(state, dict) or state.get('url') != url:
+        _reset_part(part_path, state_path)
+        state = {}
+    state['url'] = url
+    return state
+
+def _save_part_state(state_path, state):
+    from resources.lib.utils import save_json_state
+    save_json_state(state_path, state)
+
+def _reset_part(part_path, state_path):
+    for path in (part_path, state_path):
+        if os.path.exists(path):
+            os.remove(path)
+
+def _new_digest():
+    return {'sha256': hashlib.sha256(), 'size': 0}
+
+def _sync_digest(digest, part_path, offset):
+    """
+    Allinea l'hash ai byte già presenti nel .part. Durante i tentativi della
+    stessa chiamata l'hash è già aggiornato; il file viene riletto solo quando
+    si riprende un .part lasciato da una chiamata precedente.
+    """
+    if digest['size'] == offset:
+        return
+    digest.update(_new_digest())
+    with open(part_path, 'rb') as f:
+        while digest['size'] < offset:
+            chunk = f.read(min(DOWNLOAD_CHUNK_SIZE, offset - digest['size']))
+            if not chunk:
+                break
+            digest['sha256'].update(chunk)
+            digest['size'] += len(chunk)
+
+def _transfer(url, part_path, state_path, state, progress, headers, digest):
+    """Un tentativo di download, ripreso dall'offset del .part se presente"""
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    if offset and offset == state.get('total'):
+        _sync_digest(digest, part_path, offset)
+        return state.get('final_url', url)
+
+    # identity: Content-Length e Range devono riferirsi ai byte del file
+    req_headers = {'Accept-Encoding': 'identity'}
+    req_headers.update(headers or {})
+    if offset:
+        req_headers['Range'] = f"bytes={offset}-"
+        validator = state.get('etag') or state.get('last_modified')
+        if validator:
+            # Se il file remoto è cambiato il server risponde 200 con il file intero
+            req_headers['If-Range'] = validator
+
+    try:
+        response = http_client.request(url, headers=req_headers, timeout=DOWNLOAD_TIMEOUT)
+    except urllib.error.HTTPError as e:
+        if e.code == 416 and offset:
+            # Range non valido: si riparte da zero
+            _log(f"Ripresa rifiutata per {url}, riavvio download", xbmc.LOGWARNING)
+            _reset_part(part_path, state_path)
+            state.clear()
+            state['url'] = url
+            return _transfer(url, part_path, state_path, state, progress, headers, digest)
+        raise
+
+    with response:
+        if offset and response.status == 206:
+            mode, done = 'ab', offset
+            _sync_digest(digest, part_path, offset)
+            _log(f"Ripresa download da {format_size(offset)}: {url}")
+        else:
+            mode, done = 'wb', 0
+            digest.update(_new_digest())
+
+        total = None
+        match = _CONTENT_RANGE_RE.match(response.headers.get('Content-Range', ''))
+        if match:
+            total = int(match.group(1))
+        elif response.headers.get('Content-Length'):
+            total = done + int(response.headers['Content-Length'])
+
+        state.update({
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'total': total,
+            'final_url': response.geturl()
+        })
+        _save_part_state(state_path, state)
+
+        with open(part_path, mode) as f:
+            while True:
+                chunk = response.read(DOWNLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                f.write(chunk)
+                # Hash e conteggio dei byte durante lo scaricamento: nessuna rilettura
+                digest['sha256'].update(chunk)
+                digest['size'] += len(chunk)
+                done += len(chunk)
+                progress.update(done, total, len(chunk))
+
+    if total is not None and done < total:
+        raise http.client.IncompleteRead(b'', total - done)
+    return state['final_url']
+
+def _download_with_resume(url, part_path, state_path, state, progress, headers, digest):
+    """Ripete il trasferimento dopo gli errori di rete riprendendo dal .part"""
+    attempt = 0
+    while True:
+        check_cancelled()
+        try:
+            return _transfer(url, part_path, state_path, state, progress, headers, digest)
+        except urllib.error.HTTPError as e:
+            if e.code < 500 or attempt >= DOWNLOAD_RETRIES:
+                raise DownloadError(f"HTTP {e.code} durante il download di {url}")
+        except (OSError, http.client.HTTPException) as e:
+            if attempt >= DOWNLOAD_RETRIES:
+                raise DownloadError(f"Download interrotto: {e}")
+            _log(f"Connessione persa ({e}), nuovo tentativo", xbmc.LOGWARNING)
+        attempt += 1
+        xbmc.sleep(RETRY_DELAY_MS * attempt)
+
+def _verify(digest, expected_size, expected_sha256):
+    """Confronta dimensione e SHA-256 calcolati in streaming con quelli attesi"""
+    if expected_size is not None and digest['size'] != int(expected_size):
+        raise DownloadIntegrityError(
+            f"Dimensione errata: {digest['size']} byte invece di {expected_size}")
+    if expected_sha256:
+        expected = expected_sha256.lower()
+        if expected.startswith('sha256:'):
+            expected = expected[len('sha256:'):]
+        actual = digest['sha256'].hexdigest()
+        if actual != expected:
+            raise DownloadIntegrityError(f"SHA-256 errato: {actual} invece di {expected}")
+
+def download_file(url, dest_path, title="", show_dialog=False, headers=None,
+                  expected_size=None, expected_sha256=None):
+    """
+    Scarica url in dest_path a blocchi di DOWNLOAD_CHUNK_SIZE (memoria costante).
+    I dati vanno in dest_path + ".part"; in caso di errore di rete il download
+    riprende con HTTP Range (anche in una chiamata successiva), a fine
+    trasferimento il file viene rinominato in modo atomico.
+    expected_size/expected_sha256 (facoltativi, anche nella forma "sha256:...")
+    vengono verificati sui dati in transito: un file corrotto o troncato viene
+    scartato e riscaricato fino a VERIFY_RETRIES volte.
+    Restituisce l'URL finale dopo eventuali redirect; solleva DownloadError.
+    """
+    part_path = dest_path + PART_SUFFIX
+    state_path = part_path + ".json"
+    state = _load_part_state(url, part_path, state_path)
+    progress = _Progress(title or os.path.basename(dest_path), show_dialog)
+    digest = _new_digest()
+
+    try:
+        verify_attempt = 0
+        while True:
+            final_url = _download_with_resume(url, part_path, state_path, state,
+                                              progress, headers, digest)
+            try:
+                _verify(digest, expected_size, expected_sha256)
+                break
+            except DownloadIntegrityError as e:
+                _reset_part(part_path, state_path)
+                if verify_attempt >= VERIFY_RETRIES:
+                    raise
+                verify_attempt += 1
+                _log(f"{e}: nuovo download di {url}", xbmc.LOGWARNING)
+                state.clear()
+                state['url'] = url
+                digest.update(_new_digest())
+
+        os.replace(part_path, dest_path)
+        if os.path.exists(state_path):
+            os.remove(state_path)
+        _log(f"Download completato: {dest_path}")
+        return final_url
+    finally:
+        progress.close()
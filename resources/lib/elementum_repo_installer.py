@@ -1,11 +1,13 @@
 # resources/lib/elementum_repo_installer.py
-import re
 from resources.lib.repo_installer import install_github_release
+from resources.lib.release_index import REPO_CHANNELS
 
 def download_elementum_repo():
+    spec = REPO_CHANNELS['elementum']
     return install_github_release(
-        source_predicate=lambda s: s.get('name', '').lower() == 'elementum repo',
-        repo_path_extractor=lambda url: re.search(r'https://github.com/([^/]+/[^/]+)', url).group(1),
-        asset_filter=lambda name: 'repository.elementumorg' in name.lower() and name.lower().endswith('.zip'),
-        addon_name='Elementum Repo'
+        source_predicate=spec['source'],
+        repo_path_extractor=spec['path'],
+        asset_filter=spec['asset'],
+        addon_name='Elementum Repo',
+        channel='elementum'
     )
@@ -2,7 +2,7 @@
 import os
 import xbmcgui
 import xbmc
-from .utils import log
+from .utils import log, register_local_files
 
 def show_intro_message_once(addon_name, first_run_file):
     """
@@ -20,5 +20,7 @@ def show_intro_message_once(addon_name, first_run_file):
                 "Prima di procedere ti consigliamo di unirti ai canali Telegram ufficiali.\n"
                 "Questo addon non sostituisce le guide ufficiali. Alcuni addon potrebbero necessitare dipendenze aggiuntive."
             )
+        # Il segno del primo avvio resta anche dopo un aggiornamento dell'addon
+        register_local_files(first_run_file)
     except Exception as e:
         log(f"Errore nel messaggio introduttivo: {e}", xbmc.LOGERROR)
\ No newline at end of file
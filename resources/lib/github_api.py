@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+# resources/lib/github_api.py
+# Accesso centralizzato alle API GitHub: token personale facoltativo,
+# budget X-RateLimit condiviso tra servizio e GUI, priorità (essenziali /
+# in background) e cache HTTP su disco rivalidata con richieste condizionali
+
+import hashlib
+import json
+import os
+import threading
+import socket
+import time
+import urllib.error
+from urllib.parse import urljoin, urlsplit
+import xbmc
+import xbmcaddon
+import xbmcvfs
+from resources.lib import http_client
+from resources.lib.utils import load_json_state, save_json_state
+
+API_HOST = 'api.github.com'
+
+# Priorità: le richieste avviate dall'utente passano prima di quelle in background
+ESSENTIAL = 0
+BACKGROUND = 1
+
+# Richieste lasciate alle operazioni essenziali: il background si ferma prima
+BACKGROUND_RESERVE = 10
+
+PROFILE_PATH = xbmcvfs.translatePath(xbmcaddon.Addon().getAddonInfo('profile'))
+BUDGET_FILE = os.path.join(PROFILE_PATH, 'github_rate_limit.json')
+CACHE_DIR = os.path.join(PROFILE_PATH, 'github_cache')
+
+_budget = {}
+_budget_mtime = None
+_lock = threading.Lock()
+_token_rejected = False
+
+class RateLimitDeferred(Exception):
+    """Richiesta rinviata: budget GitHub esaurito fino a reset_at (epoch)"""
+
+    def __init__(self, reset_at):
+        self.reset_at = reset_at
+        super().__init__(
+            "Limite richieste GitHub raggiunto, riprova dopo le "
+            + time.strftime('%H:%M', time.localtime(reset_at)))
+
+def _log(message, level=xbmc.LOGINFO):
+    xbmc.log(f"[GitHubAPI] {message}", level)
+
+def is_api_url(url):
+    return urlsplit(url).hostname == API_HOST
+
+def get_token():
+    """Token personale dalle impostazioni ('' se assente o rifiutato da GitHub)"""
+    if _token_rejected:
+        return ''
+    return xbmcaddon.Addon().getSetting('github_token').strip()
+
+def auth_headers(url):
+    """
+    Header Authorization per url: solo verso api.github.com e solo con un
+    token impostato. Il token non va mai nei log.
+    """
+    token = get_token()
+    if token and is_api_url(url):
+        return {'Authorization': f"token {token}"}
+    return {}
+
+def _load_budget():
+    """Budget condiviso su file: servizio e GUI girano in interpreti separati"""
+    global _budget, _budget_mtime
+    try:
+        mtime = os.path.getmtime(BUDGET_FILE)
+    except OSError:
+        return
+    if mtime == _budget_mtime:
+        return
+    budget = load_json_state(BUDGET_FILE)
+    if isinstance(budget, dict):
+        _budget = budget
+        _budget_mtime = mtime
+
+def _save_budget():
+    global _budget_mtime
+    if save_json_state(BUDGET_FILE, _budget):
+        _budget_mtime = os.path.getmtime(BUDGET_FILE)
+
+def record_rate_limit(headers, authenticated=False):
+    """
+    Aggiorna il budget dagli header X-RateLimit-* (o Retry-After) di una
+    risposta; authenticated indica se la richiesta aveva il token.
+    """
+    if headers is None:
+        return
+    resource = headers.get('X-RateLimit-Resource')
+    if resource and resource != 'core':
+        return
+    remaining = headers.get('X-RateLimit-Remaining')
+    reset = headers.get('X-RateLimit-Reset')
+    retry_after = headers.get('Retry-After')
+    with _lock:
+        if remaining is not None and reset is not None:
+            _budget.update({
+                'limit': int(headers.get('X-RateLimit-Limit') or 0),
+                'remaining': int(remaining),
+                'reset': int(reset),
+                'updated': int(time.time()),
+                'authenticated': authenticated
+            })
+        elif retry_after and retry_after.isdigit():
+            # Limite secondario: nessun budget, solo un'attesa
+            _budget.update({'remaining': 0, 'reset': int(time.time()) + int(retry_after),
+                            'updated': int(time.time()), 'authenticated': authenticated})
+        else:
+            return
+        _save_budget()
+
+def get_budget():
+    """Ultimo budget noto: {'limit', 'remaining', 'reset', 'updated'} (vuoto se mai visto)"""
+    with _lock:
+        _load_budget()
+        return dict(_budget)
+
+def seconds_until_available(priority=BACKGROUND):
+    """0 se una richiesta con questa priorità può partire, altrimenti i secondi al reset"""
+    with _lock:
+        _load_budget()
+        reset = _budget.get('reset', 0)
+        now = time.time()
+        if not _budget or reset <= now:
+            return 0
+        if _budget.get('authenticated', False) != bool(get_token()):
+            # Budget di un'altra identità (token aggiunto o rimosso): non vale
+            return 0
+        reserve = BACKGROUND_RESERVE if priority == BACKGROUND else 0
+        if _budget.get('remaining', 1) > reserve:
+            return 0
+        return int(reset - now) + 1
+
+def _reserve(priority):
+    """Consuma una richiesta dal budget locale o solleva RateLimitDeferred"""
+    wait = seconds_until_available(priority)
+    if wait:
+        raise RateLimitDeferred(time.time() + wait)
+    with _lock:
+        if _budget.get('remaining'):
+            # Stima locale fino agli header della risposta
+            _budget['remaining'] -= 1
+
+def _cache_path(url):
+    return os.path.join(CACHE_DIR, hashlib.sha1(url.encode('utf-8')).hexdigest() + '.json')
+
+def load_cached(url):
+    """
+    Voce della cache per url: {'url', 'etag', 'last_modified', 'fetched_at',
+    'data'}, None se assente o illeggibile
+    """
+    entry = load_json_state(_cache_path(url))
+    if isinstance(entry, dict) and entry.get('url') == url and 'data' in entry:
+        return entry
+    return None
+
+def save_cached(url, data, headers=None):
+    """Salva il JSON di url con i validatori (ETag, Last-Modified) della risposta"""
+    headers = headers or {}
+    save_json_state(_cache_path(url), {
+        'url': url,
+        'etag': headers.get('ETag') or '',
+        'last_modified': headers.get('Last-Modified') or '',
+        'fetched_at': int(time.time()),
+        'data': data
+    })
+
+def request(url, priority=BACKGROUND, headers=None, timeout=15, follow_redirects=True):
+    """
+    Richiesta con il client condiviso che rispetta il budget delle API GitHub.
+    Solleva RateLimitDeferred invece di spendere le ultime richieste; le
+    altre eccezioni sono quelle di http_client.request.
+    """
+    global _token_rejected
+    if not is_api_url(url):
+        return http_client.request(url, headers=headers, timeout=timeout,
+                                   follow_redirects=follow_redirects)
+    _reserve(priority)
+    req_headers = dict(headers or {})
+    req_headers.update(auth_headers(url))
+    authenticated = 'Authorization' in req_headers
+    try:
+        response = http_client.request(url, headers=req_headers, timeout=timeout,
+                                       follow_redirects=follow_redirects)
+    except urllib.error.HTTPError as e:
+        if e.code == 401 and authenticated:
+            # Token scaduto o revocato: si prosegue senza, come utente anonimo
+            _log("Token GitHub rifiutato (401), richieste senza autenticazione", xbmc.LOGWARNING)
+            _token_rejected = True
+            return request(url, priority, headers, timeout, follow_redirects)
+        record_rate_limit(e.headers, authenticated)
+        if e.code in (403, 429) and seconds_until_available(ESSENTIAL):
+            _log(f"Limite richieste raggiunto su {url}", xbmc.LOGWARNING)
+            raise RateLimitDeferred(time.time() + seconds_until_available(ESSENTIAL))
+        raise
+    record_rate_limit(response.headers, authenticated)
+    return response
+
+def resolve_download_url(url, priority=BACKGROUND, timeout=15):
+    """
+    URL da cui scaricare un file servito tramite api.github.com (zipball):
+    la richiesta API passa da budget e token, il download vero e proprio
+    va al redirect (codeload.github.com) con il motore di download.
+    """
+    with request(url, priority, timeout=timeout, follow_redirects=False) as resp:
+        if resp.status not in http_client.REDIRECT_CODES:
+            return url
+        location = resp.headers['Location']
+        resp.read()
+    return urljoin(url, location)
+
+def get_json(url, priority=BACKGROUND, headers=None, timeout=15, use_cache=True):
+    """
+    JSON da url con cache su disco: la risposta salvata viene rivalidata con
+    If-None-Match/If-Modified-Since e un 304 (che GitHub non conta nel
+    limite) la restituisce senza riscaricarla. Con budget esaurito o senza
+    rete restituisce l'ultima risposta salvata; senza cache solleva
+    RateLimitDeferred o l'errore di http_client.
+    """
+    cached = load_cached(url) if use_cache and is_api_url(url) else None
+    req_headers = dict(headers or {})
+    if cached:
+        if cached.get('etag'):
+            req_headers['If-None-Match'] = cached['etag']
+        if cached.get('last_modified'):
+            req_headers['If-Modified-Since'] = cached['last_modified']
+    try:
+        with request(url, priority, req_headers, timeout) as resp:
+            data = json.loads(resp.read().decode('utf-8'))
+            response_headers = resp.headers
+    except urllib.error.HTTPError as e:
+        if e.code != 304 or cached is None:
+            raise
+        _log(f"Invariato (304): {url}", xbmc.LOGDEBUG)
+        return cached['data']
+    except RateLimitDeferred as e:
+        if cached is None:
+            raise
+        _log(f"Budget esaurito fino alle {time.strftime('%H:%M', time.localtime(e.reset_at))}, "
+             f"uso i dati salvati per {url}")
+        return cached['data']
+    except (urllib.error.URLError, socket.timeout) as e:
+        if cached is None:
+            raise
+        _log(f"GitHub non raggiungibile ({e}), uso i dati salvati per {url}", xbmc.LOGWARNING)
+        return cached['data']
+    if use_cache and is_api_url(url):
+        save_cached(url, data, response_headers)
+    return data
+
+def check_rate_limit():
+    """
+    Interroga /rate_limit (non consuma budget) e registra il limite effettivo.
+    Restituisce il budget aggiornato; 'token_rejected' indica un token non valido.
+    """
+    try:
+        with request(f"https://{API_HOST}/rate_limit", ESSENTIAL, timeout=10) as resp:
+            core = json.loads(resp.read().decode('utf-8')).get('resources', {}).get('core', {})
+        budget = get_budget()
+        budget.update({k: core[k] for k in ('limit', 'remaining', 'reset') if k in core})
+    except Exception as e:
+        _log(f"Controllo limite GitHub fallito: {e}", xbmc.LOGWARNING)
+        budget = get_budget()
+    budget['token_rejected'] = _token_rejected
+    if 'limit' in budget:
+        auth = "con token" if budget.get('authenticated') else "senza token"
+        _log(f"Limite API GitHub {auth}: {budget.get('remaining')}/{budget['limit']} richieste, "
+             f"reset alle {time.strftime('%H:%M', time.localtime(budget.get('reset', 0)))}")
+    return budget
@@ -1,20 +1,58 @@
 import os
-import json
-import urllib.request
+import shutil
+import hashlib
+import zipfile
+import threading
+import http.client
 import urllib.error
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import xbmc
 import xbmcaddon
 import xbmcvfs
 import xbmcgui
 from resources.lib.version_utils import log_info, log_error
+from resources.lib.icon_utils import build_icon_manifest
+from resources.lib.utils import load_json_state, save_json_state, load_local_files
+from resources.lib import http_client
+from resources.lib import github_api
+from resources.lib.downloader import download_file
 
 ADDON = xbmcaddon.Addon()
 ADDON_ID = ADDON.getAddonInfo('id')
 ADDON_NAME = ADDON.getAddonInfo('name')
 PROFILE_PATH = xbmcvfs.translatePath(ADDON.getAddonInfo('profile'))
 LAST_COMMIT_FILE = os.path.join(PROFILE_PATH, 'last_commit.txt')
+# path -> {sha (blob git), size, mtime} dei file installati dalla sincronizzazione
+MANIFEST_FILE = os.path.join(PROFILE_PATH, 'sync_manifest.json')
+ZIPBALL_FILE = os.path.join(PROFILE_PATH, 'sync_zipball.zip')
+# Aggiornamento a staging: nuova versione costruita a parte e scambiata con un rename.
+# Le cartelle stanno nel profilo (stesso filesystem di addons/) e non in addons/,
+# dove Kodi le vedrebbe come una seconda copia dell'addon.
+STAGING_PATH = os.path.join(PROFILE_PATH, 'update_staging')
+PREVIOUS_PATH = os.path.join(PROFILE_PATH, 'update_previous')
+PREVIOUS_STATE_FILE = os.path.join(PROFILE_PATH, 'update_previous.json')
+# Commit annullato con il ripristino: non viene riapplicato finché non ne arriva uno nuovo
+SKIPPED_COMMIT_FILE = os.path.join(PROFILE_PATH, 'skipped_commit.txt')
+# Cartella da riportare in ADDON_PATH se un rename di aggiornamento non è stato annullato
+RESTORE_FROM_FILE = os.path.join(PROFILE_PATH, 'restore_from.txt')
 ADDON_PATH = xbmcvfs.translatePath(os.path.join('special://home/addons', ADDON_ID))
+# File mai scaricati dal repository
 IGNORE_FILES = {'.firstrun'}
+# File del repository che l'addon aggiorna da sé (update_checker): mai "riparati"
+LOCALLY_UPDATED_FILES = {'resources/addons.json'}
+# Oltre questo numero di file la risposta di /compare è troncata: sync completa
+COMPARE_MAX_FILES = 300
+# Da questo numero di file da scaricare si usa l'archivio zip del commit
+BULK_SYNC_THRESHOLD = 15
+# Download paralleli dei singoli file
+SYNC_WORKERS = 8
+MAX_REQUESTS_PER_HOST = 4
+FETCH_RETRIES = 3
+RETRY_BACKOFF = 1.0  # secondi, raddoppiato a ogni tentativo
+
+_host_limits = {}
+_host_limits_lock = threading.Lock()
 
 # Impostazioni GitHub
 github_user = ADDON.getSetting('github_user')
@@ -55,16 +93,18 @@ def handle_http_error(e):
         )
     return False
 
-def github_api_request(path, timeout=10):
-    """Chiamata alle API GitHub"""
+def github_api_request(path, timeout=10, quiet=False):
+    """Chiamata alle API GitHub (quiet: errori HTTP solo nel log, senza dialog)"""
     url = f"https://api.github.com/repos/{github_user}/{github_repo}{path}"
     try:
-        resp = urllib.request.urlopen(url, timeout=timeout)
-        if resp.getcode() != 200:
-            log_error(f"API code inaspettato {resp.getcode()} per {url}")
-            return None
-        return json.loads(resp.read().decode('utf-8'))
+        return github_api.get_json(url, github_api.BACKGROUND, timeout=timeout, use_cache=False)
+    except github_api.RateLimitDeferred as e:
+        log_info(f"Richiesta rinviata ({e}): {url}")
+        return None
     except urllib.error.HTTPError as e:
+        if quiet:
+            log_error(f"richiesta API fallita {url}: HTTP {e.code}")
+            return None
         return handle_http_error(e)
     except Exception as e:
         log_error(f"richiesta API fallita {url}: {e}")
@@ -88,78 +128,534 @@ def write_last_commit(sha):
     except Exception as e:
         log_error(f"scrittura ultimo commit: {e}")
 
+def read_skipped_commit():
+    """Commit escluso dopo un ripristino ('' se nessuno)"""
+    try:
+        if os.path.exists(SKIPPED_COMMIT_FILE):
+            with open(SKIPPED_COMMIT_FILE, 'r') as f:
+                return f.read().strip()
+    except Exception as e:
+        log_error(f"lettura commit escluso: {e}")
+    return ''
+
+def write_skipped_commit(sha):
+    """Memorizza il commit da non riapplicare; '' rimuove l'esclusione"""
+    try:
+        if not sha:
+            if os.path.exists(SKIPPED_COMMIT_FILE):
+                os.remove(SKIPPED_COMMIT_FILE)
+            return
+        with open(SKIPPED_COMMIT_FILE, 'w') as f:
+            f.write(sha)
+    except Exception as e:
+        log_error(f"scrittura commit escluso: {e}")
+
 def get_remote_commit():
     """Ottiene l'ultimo commit SHA dal ramo remoto"""
     data = github_api_request(f"/commits/{github_branch}")
     return data.get('sha', '') if data else ''
 
-def get_remote_file_list():
-    """Ottiene la lista dei file dal repository remoto"""
-    data = github_api_request(f"/git/trees/{github_branch}?recursive=1")
+def get_remote_tree(ref=None):
+    """Ottiene i file del repository remoto (ramo o commit ref) con lo SHA del blob: {path: sha}"""
+    data = github_api_request(f"/git/trees/{ref or github_branch}?recursive=1")
     if not data:
-        return []
-    return [item['path'] for item in data.get('tree', []) if item.get('type') == 'blob']
+        return {}
+    return {item['path']: item['sha'] for item in data.get('tree', []) if item.get('type') == 'blob'}
+
+def git_blob_sha(local_path):
+    """SHA-1 di un file calcolato come git ("blob <len>\\0" + contenuto)"""
+    sha = hashlib.sha1(b"blob %d\0" % os.path.getsize(local_path))
+    with open(local_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def git_blob_sha_bytes(content):
+    """SHA-1 git di un contenuto già in memoria"""
+    return hashlib.sha1(b"blob %d\0" % len(content) + content).hexdigest()
+
+def load_manifest():
+    """Manifest locale path -> {sha, size, mtime}; vuoto se assente o illeggibile"""
+    return load_json_state(MANIFEST_FILE, {})
 
-def download_content(rel_path):
-    """Scarica il contenuto di un file"""
-    url = f"https://raw.githubusercontent.com/{github_user}/{github_repo}/{github_branch}/{rel_path}"
+def save_manifest(manifest):
+    """Salva il manifest in modo atomico"""
+    save_json_state(MANIFEST_FILE, manifest)
+
+def _manifest_entry(local_path, sha):
+    st = os.stat(local_path)
+    return {'sha': sha, 'size': st.st_size, 'mtime': st.st_mtime}
+
+def local_blob_sha(rel_path, manifest, verify=False):
+    """
+    SHA del file locale: dal manifest se dimensione e mtime non sono cambiati,
+    altrimenti (o con verify=True) ricalcolato dal disco e aggiornato nel
+    manifest. None se il file non esiste.
+    """
+    local_path = os.path.join(ADDON_PATH, rel_path)
     try:
-        with urllib.request.urlopen(url, timeout=20) as response:
-            return response.read()
-    except urllib.error.HTTPError as e:
-        handle_http_error(e)
+        st = os.stat(local_path)
+    except OSError:
+        manifest.pop(rel_path, None)
+        return None
+    entry = manifest.get(rel_path)
+    if (not verify and entry and entry.get('size') == st.st_size
+            and entry.get('mtime') == st.st_mtime):
+        return entry['sha']
+    sha = git_blob_sha(local_path)
+    manifest[rel_path] = _manifest_entry(local_path, sha)
+    return sha
+
+def get_changed_files(base_commit, head_commit):
+    """
+    Elenco delle modifiche tra due commit tramite /compare/{base}...{head}.
+    Restituisce {'changed': {path: sha}, 'removed': [...]} oppure None quando serve
+    una sincronizzazione completa (commit sconosciuto, storia riscritta,
+    troppi file per una sola risposta).
+    """
+    data = github_api_request(f"/compare/{base_commit}...{head_commit}", quiet=True)
+    if not data:
+        return None
+    if data.get('status') not in ('ahead', 'identical'):
+        log_info(f"Confronto {base_commit[:7]}...{head_commit[:7]}: stato {data.get('status')}, sync completa")
+        return None
+    files = data.get('files', [])
+    if len(files) >= COMPARE_MAX_FILES:
+        log_info(f"Confronto con {len(files)} file, sync completa")
+        return None
+
+    changed, removed = {}, []
+    for item in files:
+        status = item.get('status')
+        if status == 'removed':
+            removed.append(item['filename'])
+        elif status == 'renamed':
+            removed.append(item['previous_filename'])
+            changed[item['filename']] = item.get('sha')
+        elif status != 'unchanged':
+            changed[item['filename']] = item.get('sha')
+    return {'changed': changed, 'removed': removed}
+
+def raw_file_url(rel_path, ref=None):
+    return f"https://raw.githubusercontent.com/{github_user}/{github_repo}/{ref or github_branch}/{rel_path}"
+
+def sync_orphan_files(installed_paths, remote_paths):
+    """
+    Rimuove i file installati dalla sincronizzazione (manifest) che non sono
+    più nel remoto. I file creati dall'addon o dall'utente non sono nel
+    manifest e quindi non vengono mai toccati; nessuna scansione della cartella.
+    """
+    for rel_path in set(installed_paths).difference(remote_paths):
+        remove_local_file(rel_path)
+
+def write_local_file(rel_path, content, expected_sha, manifest, base_path=None):
+    """
+    Scrive un file scaricato dopo averne verificato lo SHA git e aggiorna il
+    manifest. La scrittura passa da un file temporaneo: un hardlink condiviso
+    con la versione precedente non viene mai modificato.
+    """
+    if expected_sha and git_blob_sha_bytes(content) != expected_sha:
+        log_error(f"SHA non corrispondente per {rel_path}, file scartato")
+        return False
+    local_path = os.path.join(base_path or ADDON_PATH, rel_path)
+    existed = os.path.exists(local_path)
+    try:
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        tmp_path = local_path + '.tmp'
+        with open(tmp_path, 'wb') as local_file:
+            local_file.write(content)
+        os.replace(tmp_path, local_path)
+        manifest[rel_path] = _manifest_entry(local_path, expected_sha or git_blob_sha_bytes(content))
+        log_info(f"File {'aggiornato' if existed else 'scaricato'}: {rel_path}")
+        return True
     except Exception as e:
-        log_error(f"Errore download {rel_path}: {e}")
+        log_error(f"Errore scrittura file {rel_path}: {e}")
+        return False
+
+def download_zipball_files(files, ref, manifest, base_path=None):
+    """
+    Scarica una sola volta l'archivio zip del commit ref ed estrae solo i
+    file richiesti ({path: sha}). Restituisce i file non estratti.
+    """
+    url = f"https://api.github.com/repos/{github_user}/{github_repo}/zipball/{ref}"
+    pending = dict(files)
+    try:
+        # Redirect risolto tramite github_api (budget e token), archivio da codeload
+        download_file(github_api.resolve_download_url(url), ZIPBALL_FILE)
+        with zipfile.ZipFile(ZIPBALL_FILE) as archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                # Le voci hanno il prefisso "<owner>-<repo>-<sha>/"
+                rel_path = info.filename.split('/', 1)[-1]
+                if rel_path in pending and write_local_file(
+                        rel_path, archive.read(info), pending[rel_path], manifest, base_path):
+                    del pending[rel_path]
+    except Exception as e:
+        log_error(f"Errore sincronizzazione da archivio: {e}")
+    finally:
+        if os.path.exists(ZIPBALL_FILE):
+            os.remove(ZIPBALL_FILE)
+    return pending
+
+def _host_limit(url):
+    """Semaforo che limita le richieste contemporanee verso lo stesso host"""
+    host = urlsplit(url).hostname
+    with _host_limits_lock:
+        if host not in _host_limits:
+            _host_limits[host] = threading.Semaphore(MAX_REQUESTS_PER_HOST)
+        return _host_limits[host]
+
+def _fetch_with_retry(rel_path, ref, stop_event):
+    """
+    Scarica un file riprovando con backoff esponenziale sugli errori
+    transitori (rete, 5xx). Un 403/429 (limite richieste) ferma tutti i download.
+    Restituisce None se il fetcher è stato fermato.
+    """
+    url = raw_file_url(rel_path, ref)
+    for attempt in range(FETCH_RETRIES + 1):
+        if stop_event.is_set():
+            return None
+        try:
+            with _host_limit(url):
+                with http_client.request(url, timeout=20) as response:
+                    return response.read()
+        except urllib.error.HTTPError as e:
+            if e.code in (403, 429):
+                stop_event.set()
+                raise
+            if e.code < 500 or attempt == FETCH_RETRIES:
+                raise
+        except (OSError, http.client.HTTPException):
+            if attempt == FETCH_RETRIES:
+                raise
+        stop_event.wait(RETRY_BACKOFF * 2 ** attempt)
     return None
 
-def sync_orphan_files(remote_paths):
-    """Rimuove i file locali non presenti nel remoto"""
-    for root, _, files in os.walk(ADDON_PATH, topdown=False):
-        for name in files:
-            full_path = os.path.join(root, name)
-            rel_path = os.path.relpath(full_path, ADDON_PATH).replace('\\', '/')
-            
-            if rel_path in IGNORE_FILES:
-                continue
-                
-            if rel_path not in remote_paths:
-                try:
-                    os.remove(full_path)
-                    log_info(f"Rimosso file orfano: {rel_path}")
-                except Exception as e:
-                    log_error(f"Errore rimozione file orfano {rel_path}: {e}")
-        
-        if not os.listdir(root) and root != ADDON_PATH:
+def download_files_parallel(files, ref, manifest, base_path=None):
+    """
+    Scarica i file {path: sha} con un pool limitato di thread; ogni file viene
+    scritto su disco appena arriva, mentre gli altri sono ancora in download.
+    Restituisce True se tutti i file sono stati scritti.
+    """
+    if not files:
+        return True
+    stop_event = threading.Event()
+    rate_limited = None
+    ok = True
+    with ThreadPoolExecutor(max_workers=SYNC_WORKERS) as pool:
+        futures = {pool.submit(_fetch_with_retry, rel_path, ref, stop_event): (rel_path, sha)
+                   for rel_path, sha in files.items()}
+        for future in as_completed(futures):
+            rel_path, sha = futures[future]
             try:
-                os.rmdir(root)
-                log_info(f"Rimossa cartella vuota: {os.path.relpath(root, ADDON_PATH)}")
-            except Exception as e:
-                log_error(f"Errore rimozione cartella vuota: {e}")
-
-def sync_all(remote_paths):
-    """Sincronizza tutti i file con il repository remoto"""
-    for rel_path in remote_paths:
-        local_path = os.path.join(ADDON_PATH, rel_path)
-        remote_content = download_content(rel_path)
-        
-        if remote_content is None:
-            continue
-            
-        file_exists = os.path.exists(local_path)
-        if file_exists:
-            try:
-                with open(local_path, 'rb') as local_file:
-                    if local_file.read() == remote_content:
-                        continue
+                remote_content = future.result()
+            except urllib.error.HTTPError as e:
+                if e.code in (403, 429) and rate_limited is None:
+                    rate_limited = e
+                    for pending in futures:
+                        pending.cancel()
+                log_error(f"Errore download {rel_path}: HTTP {e.code}")
+                ok = False
+                continue
             except Exception as e:
-                log_error(f"Errore lettura file locale {rel_path}: {e}")
-        
+                log_error(f"Errore download {rel_path}: {e}")
+                ok = False
+                continue
+            if remote_content is None or not write_local_file(rel_path, remote_content, sha, manifest, base_path):
+                ok = False
+
+    if rate_limited is not None:
+        handle_http_error(rate_limited)
+    return ok
+
+def fetch_files(files, ref, manifest, base_path=None):
+    """
+    Scarica i file {path: sha}: con almeno BULK_SYNC_THRESHOLD file una sola
+    richiesta per l'archivio del commit, altrimenti (o per quelli rimasti)
+    download paralleli dei singoli file. True se tutti i file sono stati scritti.
+    """
+    # L'archivio passa da api.github.com: con il budget esaurito si usano i file raw
+    if len(files) >= BULK_SYNC_THRESHOLD and not github_api.seconds_until_available(github_api.BACKGROUND):
+        log_info(f"{len(files)} file da aggiornare: download dell'archivio {ref}")
+        files = download_zipball_files(files, ref, manifest, base_path)
+    return download_files_parallel(files, ref, manifest, base_path)
+
+def _remove_tree(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+
+def _link_or_copy(src, dst):
+    """Hardlink del file (nessuna copia); copia se il filesystem non lo supporta"""
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+def _undo_rename(src):
+    """
+    Riporta src in ADDON_PATH dopo un rename fallito. Se non riesce (es. file
+    bloccato) la cartella viene annotata e ripristinata al prossimo avvio del
+    servizio da restore_addon_path.
+    """
+    try:
+        os.rename(src, ADDON_PATH)
+    except OSError as e:
+        log_error(f"Impossibile riportare {src} nella cartella dell'addon: {e}")
+        try:
+            with open(RESTORE_FROM_FILE, 'w') as f:
+                f.write(src)
+        except Exception as e:
+            log_error(f"scrittura cartella da ripristinare: {e}")
+
+def restore_addon_path():
+    """
+    Se un aggiornamento o un ripristino interrotto ha lasciato mancante la
+    cartella dell'addon, la riporta dalla cartella annotata da _undo_rename
+    (o da PREVIOUS_PATH/STAGING_PATH). True se la cartella è al suo posto.
+    """
+    restore_from = ''
+    if os.path.exists(RESTORE_FROM_FILE):
         try:
-            os.makedirs(os.path.dirname(local_path), exist_ok=True)
-            with open(local_path, 'wb') as local_file:
-                local_file.write(remote_content)
-            log_info(f"File {'aggiornato' if file_exists else 'scaricato'}: {rel_path}")
+            with open(RESTORE_FROM_FILE, 'r') as f:
+                restore_from = f.read().strip()
         except Exception as e:
-            log_error(f"Errore scrittura file {rel_path}: {e}")
-    
-    sync_orphan_files(remote_paths)
+            log_error(f"lettura cartella da ripristinare: {e}")
+    if not os.path.isdir(ADDON_PATH):
+        src = next((p for p in (restore_from, PREVIOUS_PATH, STAGING_PATH) if p and os.path.isdir(p)), None)
+        if not src:
+            log_error("Cartella dell'addon mancante e nessuna versione da ripristinare")
+            return False
+        try:
+            os.rename(src, ADDON_PATH)
+        except OSError as e:
+            log_error(f"Ripristino della cartella dell'addon da {src} non riuscito: {e}")
+            return False
+        log_info(f"Cartella dell'addon ripristinata da {src}")
+    if restore_from:
+        os.remove(RESTORE_FROM_FILE)
+    return True
+
+def _swap_in_staging(old_manifest):
+    """
+    Sostituisce la cartella dell'addon con quella di staging; la versione
+    attuale diventa PREVIOUS_PATH per il ripristino. False se il rename
+    non è possibile (la cartella live resta com'era).
+    """
+    _remove_tree(PREVIOUS_PATH)
+    previous_commit = read_last_commit()
+    try:
+        os.rename(ADDON_PATH, PREVIOUS_PATH)
+    except OSError as e:
+        log_error(f"Impossibile spostare la versione attuale: {e}")
+        return False
+    try:
+        os.rename(STAGING_PATH, ADDON_PATH)
+    except OSError as e:
+        log_error(f"Impossibile attivare la nuova versione: {e}")
+        _undo_rename(PREVIOUS_PATH)
+        return False
+    save_json_state(PREVIOUS_STATE_FILE, {'commit': previous_commit, 'manifest': old_manifest})
+    return True
+
+def staged_sync(new_tree, ref, verify=False, keep=()):
+    """
+    Costruisce la versione new_tree ({path: sha}) in STAGING_PATH: i file
+    invariati sono hardlink di quelli attuali, solo quelli cambiati vengono
+    scaricati. A download completati la cartella viene scambiata con un
+    rename, quindi i file orfani spariscono con la vecchia versione e un
+    aggiornamento non è mai applicato a metà. Della cartella attuale vengono
+    riportati solo i file del manifest e quelli annotati come creati
+    dall'addon (utils.register_local_files): nessuna scansione della cartella.
+    keep: path da riportare così come sono nella cartella attuale.
+    Restituisce True/False (cartella attuale intatta in caso di errore, o da
+    ripristinare al prossimo avvio se il rename non è stato annullato) oppure
+    None se lo staging non è possibile e bisogna aggiornare sul posto.
+    """
+    manifest = load_manifest()
+    staged = {}
+    to_fetch = {}
+    _remove_tree(STAGING_PATH)
+    try:
+        for rel_path, sha in new_tree.items():
+            if rel_path in IGNORE_FILES:
+                continue
+            live_path = os.path.join(ADDON_PATH, rel_path)
+            staged_path = os.path.join(STAGING_PATH, rel_path)
+            if rel_path in keep and os.path.exists(live_path):
+                _link_or_copy(live_path, staged_path)
+                installed = manifest.get(rel_path, {}).get('sha') or sha
+                staged[rel_path] = _manifest_entry(staged_path, installed)
+            elif local_blob_sha(rel_path, manifest, verify) == sha:
+                _link_or_copy(live_path, staged_path)
+                staged[rel_path] = _manifest_entry(staged_path, sha)
+            else:
+                to_fetch[rel_path] = sha
+        for rel_path in load_local_files():
+            live_path = os.path.join(ADDON_PATH, rel_path)
+            if (rel_path not in new_tree or rel_path in IGNORE_FILES) and os.path.exists(live_path):
+                _link_or_copy(live_path, os.path.join(STAGING_PATH, rel_path))
+    except OSError as e:
+        log_error(f"Staging non disponibile, aggiornamento sul posto: {e}")
+        _remove_tree(STAGING_PATH)
+        return None
+
+    if to_fetch:
+        log_info(f"{len(to_fetch)} file da scaricare, {len(staged)} invariati")
+    if not fetch_files(to_fetch, ref, staged, STAGING_PATH):
+        log_error("Download incompleto: aggiornamento annullato, versione attuale invariata")
+        _remove_tree(STAGING_PATH)
+        return False
+
+    if not _swap_in_staging(manifest):
+        _remove_tree(STAGING_PATH)
+        # Senza cartella dell'addon (rename non annullato) niente aggiornamento sul posto
+        return None if os.path.isdir(ADDON_PATH) else False
+    save_manifest(staged)
+    log_info("Nuova versione attivata")
+    return True
+
+def rollback_update():
+    """Ripristina la versione precedente all'ultimo aggiornamento a staging"""
+    if not os.path.isdir(PREVIOUS_PATH):
+        return False
+    _remove_tree(STAGING_PATH)
+    try:
+        os.rename(ADDON_PATH, STAGING_PATH)
+    except OSError as e:
+        log_error(f"Ripristino non riuscito: {e}")
+        return False
+    try:
+        os.rename(PREVIOUS_PATH, ADDON_PATH)
+    except OSError as e:
+        log_error(f"Ripristino non riuscito: {e}")
+        _undo_rename(STAGING_PATH)
+        return False
+
+    # I file creati dall'addon restano quelli più recenti anche nella versione ripristinata
+    for rel_path in load_local_files():
+        newer = os.path.join(STAGING_PATH, rel_path)
+        if os.path.exists(newer):
+            restored = os.path.join(ADDON_PATH, rel_path)
+            os.makedirs(os.path.dirname(restored), exist_ok=True)
+            os.replace(newer, restored)
+    _remove_tree(STAGING_PATH)
+
+    # Il commit appena annullato non va riapplicato al prossimo avvio del servizio
+    write_skipped_commit(read_last_commit())
+    state = load_json_state(PREVIOUS_STATE_FILE)
+    if state:
+        write_last_commit(state.get('commit', ''))
+        save_manifest(state.get('manifest', {}))
+        os.remove(PREVIOUS_STATE_FILE)
+    build_icon_manifest()
+    log_info("Ripristinata la versione precedente")
+    return True
+
+def sync_all(remote_tree, verify=False, ref=None):
+    """
+    Sincronizza tutti i file con il repository remoto ({path: sha blob}).
+    Vengono scaricati solo i file il cui SHA locale (dal manifest o calcolato
+    dal disco) è diverso da quello remoto; con verify=True gli SHA locali sono
+    sempre ricalcolati e i file corrotti vengono riparati.
+    L'aggiornamento avviene a staging; sul posto solo se il rename non è possibile.
+    Restituisce False se qualche file non è stato scaricato.
+    """
+    result = staged_sync(remote_tree, ref or github_branch, verify)
+    if result is None:
+        result = _sync_all_in_place(remote_tree, verify, ref)
+    build_icon_manifest()
+    return result
+
+def _sync_all_in_place(remote_tree, verify=False, ref=None):
+    """Sincronizzazione diretta nella cartella dell'addon"""
+    manifest = load_manifest()
+    to_fetch = {rel_path: sha for rel_path, sha in remote_tree.items()
+                if rel_path not in IGNORE_FILES
+                and local_blob_sha(rel_path, manifest, verify) != sha}
+    ok = fetch_files(to_fetch, ref or github_branch, manifest)
+
+    orphans = set(manifest).difference(remote_tree)
+    sync_orphan_files(orphans, remote_tree)
+    for rel_path in orphans:
+        del manifest[rel_path]
+    save_manifest(manifest)
+    return ok
+
+def repair_local_files(verify=False):
+    """
+    Riscarica i file del manifest mancanti o diversi dallo SHA installato.
+    Senza verify vengono ricalcolati solo i file con dimensione o mtime
+    cambiati; con verify=True tutti. Restituisce i path riparati.
+    """
+    manifest = load_manifest()
+    expected = {rel_path: entry.get('sha') for rel_path, entry in manifest.items()}
+    damaged = [rel_path for rel_path, sha in expected.items()
+               if rel_path not in LOCALLY_UPDATED_FILES
+               and local_blob_sha(rel_path, manifest, verify) != sha]
+    for rel_path in damaged:
+        log_info(f"File locale alterato o mancante: {rel_path}")
+    fetch_files({rel_path: expected[rel_path] for rel_path in damaged}, github_branch, manifest)
+
+    repaired = []
+    for rel_path in damaged:
+        if manifest.get(rel_path, {}).get('sha') == expected[rel_path]:
+            repaired.append(rel_path)
+        else:
+            # Resta da riparare: la voce forza un nuovo controllo al prossimo avvio
+            manifest[rel_path] = {'sha': expected[rel_path], 'size': -1, 'mtime': 0}
+    if damaged:
+        save_manifest(manifest)
+    return repaired
+
+def remove_local_file(rel_path):
+    """Rimuove un file dell'addon e le cartelle rimaste vuote"""
+    local_path = os.path.join(ADDON_PATH, rel_path)
+    if not os.path.exists(local_path):
+        return
+    try:
+        os.remove(local_path)
+        log_info(f"Rimosso file: {rel_path}")
+        parent = os.path.dirname(local_path)
+        while parent != ADDON_PATH and not os.listdir(parent):
+            os.rmdir(parent)
+            parent = os.path.dirname(parent)
+    except Exception as e:
+        log_error(f"Errore rimozione file {rel_path}: {e}")
+
+def has_manifest():
+    """True se esiste il manifest dei file installati (completo dopo la prima sync)"""
+    return os.path.exists(MANIFEST_FILE)
+
+def sync_changes(changes, ref):
+    """
+    Applica solo le modifiche indicate da get_changed_files scaricando i file
+    al commit ref. Restituisce False se qualche download non è riuscito,
+    così l'aggiornamento viene ritentato al prossimo avvio.
+    """
+    manifest = load_manifest()
+    if manifest:
+        new_tree = {rel_path: entry.get('sha') for rel_path, entry in manifest.items()}
+        for rel_path in changes['removed']:
+            new_tree.pop(rel_path, None)
+        new_tree.update(changes['changed'])
+        keep = LOCALLY_UPDATED_FILES - set(changes['changed'])
+        result = staged_sync(new_tree, ref, keep=keep)
+        if result is not None:
+            build_icon_manifest()
+            return result
+
+    for rel_path in changes['removed']:
+        if rel_path not in IGNORE_FILES:
+            remove_local_file(rel_path)
+            manifest.pop(rel_path, None)
+
+    to_fetch = {rel_path: sha for rel_path, sha in changes['changed'].items()
+                if rel_path not in IGNORE_FILES
+                and not (sha and local_blob_sha(rel_path, manifest) == sha)}
+    ok = fetch_files(to_fetch, ref, manifest)
+
+    save_manifest(manifest)
+    build_icon_manifest()
+    return ok
@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+# resources/lib/http_client.py
+# Client HTTP condiviso: connessioni persistenti per host, gzip, timeout e
+# User-Agent uniformi e tempi di ogni richiesta
+
+import http.client
+import io
+import json
+import socket
+import ssl
+import threading
+import time
+import urllib.error
+import zlib
+from urllib.parse import urljoin, urlsplit
+import xbmc
+
+DEFAULT_TIMEOUT = 15
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)'
+MAX_IDLE_PER_HOST = 4
+IDLE_TIMEOUT = 60
+MAX_REDIRECTS = 5
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+
+_pool = {}
+_pool_lock = threading.Lock()
+_ssl_context = None
+
+def _log(message, level=xbmc.LOGDEBUG):
+    xbmc.log(f"[HTTP] {message}", level)
+
+def _get_ssl_context():
+    global _ssl_context
+    if _ssl_context is None:
+        _ssl_context = ssl.create_default_context()
+    return _ssl_context
+
+def _pool_key(parts):
+    port = parts.port or (443 if parts.scheme == 'https' else 80)
+    return (parts.scheme, parts.hostname, port)
+
+def _acquire(key, timeout):
+    """Connessione inattiva dal pool o nuova; restituisce (conn, riusata)"""
+    now = time.monotonic()
+    with _pool_lock:
+        idle = _pool.get(key, [])
+        while idle:
+            conn, last_used = idle.pop()
+            if now - last_used < IDLE_TIMEOUT:
+                conn.timeout = timeout
+                if conn.sock is not None:
+                    conn.sock.settimeout(timeout)
+                return conn, True
+            conn.close()
+
+    scheme, host, port = key
+    if scheme == 'https':
+        return http.client.HTTPSConnection(host, port, timeout=timeout,
+                                           context=_get_ssl_context()), False
+    return http.client.HTTPConnection(host, port, timeout=timeout), False
+
+def _release(key, conn):
+    """Rimette nel pool una connessione con la risposta letta per intero"""
+    with _pool_lock:
+        idle = _pool.setdefault(key, [])
+        if len(idle) < MAX_IDLE_PER_HOST:
+            idle.append((conn, time.monotonic()))
+            return
+    conn.close()
+
+def close_all():
+    """Chiude tutte le connessioni inattive (es. all'uscita del servizio)"""
+    with _pool_lock:
+        for idle in _pool.values():
+            for conn, _ in idle:
+                conn.close()
+        _pool.clear()
+
+class HTTPResponse:
+    """
+    Risposta compatibile con quella di urllib (status, getcode(), headers,
+    geturl(), read()). Il corpo gzip viene decompresso al volo; quando è
+    stato letto tutto la connessione torna nel pool.
+    timing: 'connect' e 'ttfb' (fino agli header) e 'total' in secondi.
+    """
+
+    def __init__(self, url, raw, conn, key, timing):
+        self.url = url
+        self.status = raw.status
+        self.reason = raw.reason
+        self.headers = raw.headers
+        self.timing = timing
+        self._raw = raw
+        self._conn = conn
+        self._key = key
+        self._started = time.monotonic() - timing['ttfb']
+        self._decoder = None
+        if (raw.headers.get('Content-Encoding') or '').lower() == 'gzip':
+            self._decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def getcode(self):
+        return self.status
+
+    def geturl(self):
+        return self.url
+
+    def info(self):
+        return self.headers
+
+    def read(self, amt=None):
+        if self._raw is None:
+            return b''
+        try:
+            if self._decoder is None:
+                data = self._raw.read() if amt is None else self._raw.read(amt)
+            else:
+                data = self._read_gzip(amt)
+        except BaseException:
+            self._finish(reusable=False)
+            raise
+        if self._raw.isclosed():
+            self._finish(reusable=True)
+        return data
+
+    def _read_gzip(self, amt):
+        if amt is None:
+            return self._decoder.decompress(self._raw.read()) + self._decoder.flush()
+        # Un blocco compresso può non produrre ancora dati: b'' solo a fine corpo
+        while True:
+            chunk = self._raw.read(amt)
+            if not chunk:
+                return self._decoder.flush()
+            data = self._decoder.decompress(chunk)
+            if data:
+                return data
+
+    def _finish(self, reusable):
+        raw, self._raw = self._raw, None
+        if raw is None:
+            return
+        self.timing['total'] = time.monotonic() - self._started
+        _log(f"{self.status} {self.url} connect={self.timing['connect'] * 1000:.0f}ms "
+             f"ttfb={self.timing['ttfb'] * 1000:.0f}ms total={self.timing['total'] * 1000:.0f}ms")
+        if reusable and not raw.will_close:
+            _release(self._key, self._conn)
+        else:
+            raw.close()
+            self._conn.close()
+
+    def close(self):
+        # Corpo non letto per intero: la connessione non è riutilizzabile
+        self._finish(reusable=self._raw is not None and self._raw.isclosed())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+        return False
+
+def _send(method, url, headers, body, timeout):
+    """Una richiesta senza redirect; riprova una volta se la connessione riusata era chiusa"""
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https'):
+        raise urllib.error.URLError(f"schema non supportato: {url}")
+    key = _pool_key(parts)
+    path = parts.path or '/'
+    if parts.query:
+        path += '?' + parts.query
+
+    for attempt in range(2):
+        conn, reused = _acquire(key, timeout)
+        started = time.monotonic()
+        connect = 0
+        try:
+            if conn.sock is None:
+                conn.connect()
+                connect = time.monotonic() - started
+            conn.request(method, path, body=body, headers=headers)
+            raw = conn.getresponse()
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError) as e:
+            conn.close()
+            if reused and attempt == 0:
+                continue  # Il server aveva chiuso la connessione inattiva
+            raise urllib.error.URLError(e)
+        except (OSError, http.client.HTTPException) as e:
+            conn.close()
+            if isinstance(e, socket.timeout):
+                raise
+            raise urllib.error.URLError(e)
+        timing = {'connect': connect, 'ttfb': time.monotonic() - started, 'total': None}
+        return HTTPResponse(url, raw, conn, key, timing)
+
+def request(url, method='GET', headers=None, data=None, timeout=DEFAULT_TIMEOUT,
+            follow_redirects=True):
+    """
+    Esegue una richiesta riutilizzando le connessioni persistenti per host.
+    Segue i redirect (senza inoltrare Authorization a un host diverso) e,
+    come urllib, solleva urllib.error.HTTPError per le risposte non 2xx
+    (304 compreso) e urllib.error.URLError per gli errori di connessione.
+    Con follow_redirects=False un redirect viene restituito come risposta.
+    """
+    req_headers = {'User-Agent': USER_AGENT, 'Accept-Encoding': 'gzip'}
+    for name, value in (headers or {}).items():
+        req_headers[name.title()] = value
+
+    for _ in range(MAX_REDIRECTS + 1):
+        response = _send(method, url, req_headers, data, timeout)
+        is_redirect = response.status in REDIRECT_CODES and response.headers.get('Location')
+        if is_redirect and not follow_redirects:
+            return response
+        if is_redirect:
+            response.read()
+            response.close()
+            target = urljoin(url, response.headers['Location'])
+            if urlsplit(target).hostname != urlsplit(url).hostname:
+                req_headers.pop('Authorization', None)
+            if response.status == 303:
+                method, data = 'GET', None
+            url = target
+            continue
+        if not 200 <= response.status < 300:
+            try:
+                body = response.read()
+            except Exception:
+                body = b''
+            finally:
+                response.close()
+            raise urllib.error.HTTPError(url, response.status, response.reason,
+                                         response.headers, io.BytesIO(body))
+        return response
+
+    raise urllib.error.HTTPError(url, response.status, "Troppi redirect", response.headers, None)
+
+def get(url, headers=None, timeout=DEFAULT_TIMEOUT):
+    """GET con il client condiviso"""
+    return request(url, headers=headers, timeout=timeout)
+
+def get_json(url, headers=None, timeout=DEFAULT_TIMEOUT):
+    """GET di un documento JSON con il client condiviso"""
+    with request(url, headers=headers, timeout=timeout) as resp:
+        return json.loads(resp.read().decode('utf-8'))
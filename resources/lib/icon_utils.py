@@ -2,7 +2,13 @@
 import os
 import re
 import xbmc
-from resources.lib.utils import log
+from resources.lib.utils import log, load_json_state, save_json_state, ADDON_PATH, PROFILE_PATH
+
+ICONS_BASE = os.path.join(ADDON_PATH, 'resources', 'icone')
+ICON_MANIFEST_FILE = os.path.join(PROFILE_PATH, 'icon_manifest.json')
+
+# Manifest in memoria: {'signature': mtime cartella icone, 'folders': {cartella: path relativo}, 'default': ...}
+_manifest = None
 
 def normalize_folder_name(name):
     remove = ["repo", "repository", "addon", "per", "l'", "di", "da", "e"]
@@ -38,4 +44,49 @@ def create_icon_folder_if_missing(path):
         except Exception as e:
             log(f"Errore creazione cartella: {str(e)}", xbmc.LOGERROR)
             return False
-    return True
\ No newline at end of file
+    return True
+
+def _icons_signature():
+    """mtime della cartella icone, None se non esiste"""
+    try:
+        return os.stat(ICONS_BASE).st_mtime
+    except OSError:
+        return None
+
+def build_icon_manifest():
+    """Scansiona una sola volta resources/icone e salva il manifest delle icone"""
+    global _manifest
+    folders = {}
+    default = None
+    signature = _icons_signature()
+    if signature is not None:
+        for entry in os.listdir(ICONS_BASE):
+            folder_path = os.path.join(ICONS_BASE, entry)
+            if os.path.isdir(folder_path):
+                for f in os.listdir(folder_path):
+                    if f.lower().startswith('icon'):
+                        folders[entry.lower()] = f"{entry}/{f}"
+                        break
+            elif entry == 'default.png':
+                default = entry
+
+    _manifest = {'signature': signature, 'folders': folders, 'default': default}
+    save_json_state(ICON_MANIFEST_FILE, _manifest)
+    log(f"Manifest icone creato: {len(folders)} cartelle")
+    return _manifest
+
+def get_icon_manifest():
+    """Restituisce il manifest, ricostruendolo solo se la cartella icone è cambiata"""
+    global _manifest
+    signature = _icons_signature()
+    if _manifest is None:
+        _manifest = load_json_state(ICON_MANIFEST_FILE)
+    if _manifest is None or _manifest.get('signature') != signature:
+        return build_icon_manifest()
+    return _manifest
+
+def get_icon_path(name):
+    """Percorso dell'icona di una voce del catalogo (o default.png), senza accedere al disco"""
+    manifest = get_icon_manifest()
+    rel = manifest['folders'].get(normalize_folder_name(name)) or manifest.get('default')
+    return os.path.join(ICONS_BASE, *rel.split('/')) if rel else None
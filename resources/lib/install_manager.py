@@ -34,6 +34,8 @@ def cleanup_temp_install_folders():
     """Pulizia avanzata solo dopo installazione effettiva"""
     cleaned_something = False
     messages = []
+    # Tutte le modifiche a sources.xml della pulizia in un'unica transazione
+    sources_tx = sources_manager.SourcesTransaction()
     
     for install in TEMP_INSTALLS:
         addon_id = install["addon_id"]
@@ -113,7 +115,8 @@ def cleanup_temp_install_folders():
                     "url": virtual_path
                 }
                 
-                if sources_manager.add_source_to_xml(fake_repo):
+                # Salvata subito: InstallFromZip deve già vedere la sorgente
+                if sources_tx.add(fake_repo) and sources_tx.commit():
                     log_info(f"Aggiunta sorgente {source_name}")
                 
                 # Apre installazione
@@ -162,7 +165,7 @@ def cleanup_temp_install_folders():
                         "url": virtual_path
                     }
                     
-                    if sources_manager.remove_source_from_xml(fake_repo):
+                    if sources_tx.remove(fake_repo):
                         msg = f"Rimossa sorgente {source_name} da sources.xml"
                         messages.append(msg)
                         cleaned_this = True
@@ -191,7 +194,7 @@ def cleanup_temp_install_folders():
                     "url": virtual_path
                 }
                 
-                if sources_manager.remove_source_from_xml(fake_repo):
+                if sources_tx.remove(fake_repo):
                     msg = f"Rimossa sorgente {source_name} da sources.xml"
                     messages.append(msg)
                     cleaned_this = True
@@ -214,6 +217,9 @@ def cleanup_temp_install_folders():
         if cleaned_this:
             cleaned_something = True
 
+    if not sources_tx.commit():
+        log_error("Errore salvataggio sources.xml durante la pulizia")
+
     # Notifica finale
     if cleaned_something:
         summary = "Operazioni completate:\n" + "\n".join(f"- {msg}" for msg in messages)
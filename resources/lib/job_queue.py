@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+# resources/lib/job_queue.py
+# Coda di lavori in background per le operazioni lanciate dalla GUI
+
+import queue
+import threading
+import traceback
+import xbmc
+
+_local = threading.local()
+
+class JobCancelled(BaseException):
+    """
+    Sollevata dentro un lavoro quando ne è stata richiesta la cancellazione.
+    Deriva da BaseException (come asyncio.CancelledError) per non essere
+    intercettata dai blocchi "except Exception" degli installer.
+    """
+
+def current_job():
+    """Lavoro in esecuzione nel thread corrente, None fuori dalla coda"""
+    return getattr(_local, 'job', None)
+
+def check_cancelled():
+    """Punto di cancellazione cooperativa: solleva JobCancelled se richiesto"""
+    job = current_job()
+    if job is not None and job.cancelled:
+        raise JobCancelled(job.name)
+
+def report_progress(percent, message=""):
+    """Segnala l'avanzamento del lavoro corrente (ignorato fuori dalla coda)"""
+    job = current_job()
+    if job is not None:
+        job.report(percent, message)
+
+class Job:
+    """Un'operazione accodata: funzione, argomenti e callback di completamento"""
+
+    def __init__(self, name, func, args, kwargs, on_done=None, on_error=None):
+        self.name = name
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.on_done = on_done
+        self.on_error = on_error
+        self._cancel_event = threading.Event()
+        self._progress_callback = None
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    def report(self, percent, message=""):
+        if self._progress_callback:
+            try:
+                self._progress_callback(self, max(0, min(100, int(percent))), message)
+            except Exception as e:
+                xbmc.log(f"[JobQueue] Errore callback avanzamento: {e}", xbmc.LOGERROR)
+
+class JobQueue:
+    """
+    Esegue i lavori su uno o più thread, così la GUI resta reattiva e più
+    operazioni possono sovrapporre le attese di rete.
+
+    progress_callback(job, percent, message) viene chiamata dai thread di
+    lavoro a ogni avanzamento; con job=None quando la coda torna vuota.
+    """
+
+    def __init__(self, workers=2, progress_callback=None):
+        self._queue = queue.Queue()
+        self._progress_callback = progress_callback
+        self._lock = threading.Lock()
+        self._jobs = []
+        self._threads = []
+        for i in range(max(1, workers)):
+            t = threading.Thread(target=self._worker, name=f"JobWorker-{i}")
+            t.daemon = True
+            t.start()
+            self._threads.append(t)
+
+    @property
+    def busy(self):
+        with self._lock:
+            return bool(self._jobs)
+
+    def is_pending(self, name):
+        """True se un lavoro con questo nome è in coda o in esecuzione"""
+        with self._lock:
+            return any(job.name == name for job in self._jobs)
+
+    def submit(self, name, func, *args, on_done=None, on_error=None, **kwargs):
+        """Accoda func(*args, **kwargs); on_done(result) è chiamata al termine"""
+        job = Job(name, func, args, kwargs, on_done, on_error)
+        job._progress_callback = self._progress_callback
+        with self._lock:
+            self._jobs.append(job)
+        self._queue.put(job)
+        return job
+
+    def pending_names(self):
+        """Nomi dei lavori in coda o in esecuzione, nell'ordine di invio"""
+        with self._lock:
+            return [job.name for job in self._jobs]
+
+    def cancel(self, name):
+        """Richiede la cancellazione dei lavori con questo nome"""
+        with self._lock:
+            for job in self._jobs:
+                if job.name == name:
+                    job.cancel()
+
+    def cancel_all(self):
+        """Richiede la cancellazione di tutti i lavori in coda o in corso"""
+        with self._lock:
+            for job in self._jobs:
+                job.cancel()
+
+    def shutdown(self, cancel=True):
+        """Ferma i thread; con cancel=True annulla anche i lavori pendenti"""
+        if cancel:
+            self.cancel_all()
+        for _ in self._threads:
+            self._queue.put(None)
+
+    def _finish(self, job):
+        with self._lock:
+            if job in self._jobs:
+                self._jobs.remove(job)
+            idle = not self._jobs
+        if idle and self._progress_callback:
+            try:
+                self._progress_callback(None, 100, "")
+            except Exception as e:
+                xbmc.log(f"[JobQueue] Errore callback avanzamento: {e}", xbmc.LOGERROR)
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            if job.cancelled:
+                xbmc.log(f"[JobQueue] Lavoro annullato prima dell'avvio: {job.name}", xbmc.LOGINFO)
+                self._finish(job)
+                continue
+
+            _local.job = job
+            try:
+                job.report(0, "In corso...")
+                result = job.func(*job.args, **job.kwargs)
+                check_cancelled()
+                if job.on_done:
+                    job.on_done(result)
+            except JobCancelled:
+                xbmc.log(f"[JobQueue] Lavoro annullato: {job.name}", xbmc.LOGINFO)
+            except Exception as e:
+                xbmc.log(f"[JobQueue] Errore nel lavoro {job.name}: {traceback.format_exc()}", xbmc.LOGERROR)
+                if job.on_error:
+                    try:
+                        job.on_error(e)
+                    except Exception:
+                        xbmc.log(f"[JobQueue] Errore callback: {traceback.format_exc()}", xbmc.LOGERROR)
+            finally:
+                _local.job = None
+                self._finish(job)
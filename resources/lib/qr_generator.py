@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 import os
+import hashlib
+import threading
 import pyqrcode
 import xbmcvfs
 import xbmc
@@ -16,36 +18,108 @@ NO_TELEGRAM_IMG = os.path.join(
     "skins", "default", "media", "no-telegram.png"
 )
 
-def generate_qr_code(url, name="qr"):
+# Cartella dedicata per QR code (special://profile/addon_data/plugin.id/qr/)
+QR_DIR = xbmcvfs.translatePath(f"special://profile/addon_data/{ADDON_ID}/qr/")
+QR_SCALE = 6          # scale=6 per dimensioni leggibili
+QR_CACHE_MAX = 64     # numero massimo di PNG mantenuti in cache
+
+_cache_lock = threading.Lock()
+
+def get_qr_path(url, scale=QR_SCALE):
+    """Percorso del PNG in cache per (url, scale): il nome è l'hash del contenuto"""
+    key = hashlib.sha1(f"{scale}|{url}".encode('utf-8')).hexdigest()
+    return os.path.join(QR_DIR, f"{key}.png")
+
+def get_cached_qr(url, scale=QR_SCALE):
     """
-    Genera un codice QR a partire da un URL e lo salva in una cartella permanente
+    Restituisce il QR già generato per l'URL, o None se non è in cache.
+    Non genera nulla: può essere chiamata dalla GUI senza bloccare.
+    """
+    img_path = get_qr_path(url, scale)
+    try:
+        # Aggiorna mtime: usato come "ultimo accesso" per l'eviction LRU
+        os.utime(img_path, None)
+        return img_path
+    except OSError:
+        return None
+
+def evict_qr_cache(max_entries=QR_CACHE_MAX):
+    """Rimuove i PNG meno usati di recente oltre il limite della cache"""
+    with _cache_lock:
+        try:
+            entries = []
+            for f in os.listdir(QR_DIR):
+                if f.lower().endswith('.png'):
+                    path = os.path.join(QR_DIR, f)
+                    entries.append((os.path.getmtime(path), path))
+        except OSError:
+            return
+        entries.sort(reverse=True)
+        for _, path in entries[max_entries:]:
+            try:
+                os.remove(path)
+            except OSError as e:
+                log(f"Errore rimozione QR in cache {path}: {e}", xbmc.LOGWARNING)
+
+def _render_qr(url, img_path, scale):
+    """Genera il PNG in un file temporaneo e lo sposta nella cache"""
+    if not xbmcvfs.exists(QR_DIR):
+        xbmcvfs.mkdirs(QR_DIR)
+    tmp = f"{img_path}.{threading.get_ident()}.tmp"
+    pyqrcode.create(url).png(tmp, scale=scale)
+    os.replace(tmp, img_path)
+
+def generate_qr_code(url, name="qr", scale=QR_SCALE):
+    """
+    Restituisce il QR code di un URL, generandolo solo se non è già in cache
 
     Args:
         url (str): L'URL da codificare nel QR code
-        name (str): Nome base del file (senza estensione)
+        name (str): Nome descrittivo, usato solo per il log
+        scale (int): Dimensione dei moduli del QR code
 
     Returns:
-        str: Percorso completo del file immagine generato, o immagine fallback in caso di errore
+        str: Percorso completo del file immagine, o immagine fallback in caso di errore
     """
-    try:
-        # Crea il QR code
-        qr = pyqrcode.create(url)
-
-        # Cartella dedicata per QR code (special://profile/addon_data/plugin.id/qr/)
-        qr_dir = xbmcvfs.translatePath(f"special://profile/addon_data/{ADDON_ID}/qr/")
-        
-        # Crea la cartella se non esiste
-        if not xbmcvfs.exists(qr_dir):
-            xbmcvfs.mkdirs(qr_dir)
-
-        # Percorso immagine da generare
-        img_path = os.path.join(qr_dir, f"{name}_qr.png")
-        
-        # Salva il QR code come immagine PNG
-        qr.png(img_path, scale=6)  # scale=6 per dimensioni leggibili
+    cached = get_cached_qr(url, scale)
+    if cached:
+        return cached
 
+    try:
+        img_path = get_qr_path(url, scale)
+        _render_qr(url, img_path, scale)
+        log(f"QR generato per {name}: {img_path}")
+        evict_qr_cache()
         return img_path
 
     except Exception as e:
         log(f"Errore generazione QR: {str(e)}", xbmc.LOGERROR)
         return NO_TELEGRAM_IMG
+
+def prerender_qr_codes(urls, scale=QR_SCALE, on_ready=None):
+    """
+    Genera in background i QR mancanti per una lista di URL (es. tutto il catalogo)
+
+    Args:
+        urls (list): URL da codificare; duplicati e valori vuoti vengono ignorati
+        scale (int): Dimensione dei moduli del QR code
+        on_ready (callable): chiamata come on_ready(url, path) per ogni QR pronto
+
+    Returns:
+        threading.Thread: il thread avviato
+    """
+    pending = list(dict.fromkeys(u for u in urls if u))[:QR_CACHE_MAX]
+
+    def worker():
+        for url in pending:
+            path = generate_qr_code(url, scale=scale)
+            if on_ready:
+                try:
+                    on_ready(url, path)
+                except Exception as e:
+                    log(f"Errore callback QR: {e}", xbmc.LOGERROR)
+
+    thread = threading.Thread(target=worker, name="QRPrerender")
+    thread.daemon = True
+    thread.start()
+    return thread
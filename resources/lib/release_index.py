@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+# resources/lib/release_index.py
+# Indice delle release risolte per canale (YouTube Official/Beta, Trakt,
+# Sandmann, Elementum): versione, URL dell'asset, dimensione e digest.
+# Aggiornato dal servizio in background, letto dalla GUI senza rete.
+
+import os
+import re
+import threading
+import time
+import xbmc
+import xbmcaddon
+import xbmcvfs
+from resources.lib.utils import get_source, load_json_state, log, save_json_state
+from resources.lib import github_api
+
+PROFILE_PATH = xbmcvfs.translatePath(xbmcaddon.Addon().getAddonInfo('profile'))
+INDEX_FILE = os.path.join(PROFILE_PATH, 'release_index.json')
+
+# Oltre questa età gli installer risolvono di nuovo la release (richiesta
+# condizionale: con la cache di github_api di solito è un 304)
+INDEX_MAX_AGE = 6 * 3600
+
+YOUTUBE_CHANNELS = ('youtube_official', 'youtube_beta')
+TRAKT_RELEASES_URL = "https://api.github.com/repos/trakt/script.trakt/releases"
+
+# Repository installati dall'ultima release GitHub: sorgente nel catalogo,
+# percorso "owner/repo" (o URL API completo) e filtro sul nome dell'asset
+REPO_CHANNELS = {
+    'sandmann': {
+        'source': lambda s: 'sandmann79' in s.get('name', '').lower() and 'amazon' in s.get('name', '').lower(),
+        'path': lambda url: url,  # URL già API JSON
+        'asset': lambda name: name.lower().endswith('.zip')
+    },
+    'elementum': {
+        'source': lambda s: s.get('name', '').lower() == 'elementum repo',
+        'path': lambda url: re.search(r'https://github.com/([^/]+/[^/]+)', url).group(1),
+        'asset': lambda name: 'repository.elementumorg' in name.lower() and name.lower().endswith('.zip')
+    }
+}
+
+_index = {}
+_index_mtime = None
+_lock = threading.Lock()
+
+def _load():
+    """Ricarica l'indice solo se il file è cambiato (scritto dal servizio)"""
+    global _index, _index_mtime
+    try:
+        mtime = os.path.getmtime(INDEX_FILE)
+    except OSError:
+        return
+    if mtime == _index_mtime:
+        return
+    index = load_json_state(INDEX_FILE)
+    if isinstance(index, dict):
+        _index = index
+        _index_mtime = mtime
+
+def _save():
+    global _index_mtime
+    if save_json_state(INDEX_FILE, _index):
+        _index_mtime = os.path.getmtime(INDEX_FILE)
+
+def get(channel, max_age=None):
+    """
+    Release indicizzata per channel: {'version', 'url', 'size', 'digest',
+    'published_at', 'feed', 'updated'}; None se assente o più vecchia di max_age
+    """
+    with _lock:
+        _load()
+        entry = _index.get(channel)
+    if entry and max_age is not None and time.time() - entry.get('updated', 0) > max_age:
+        return None
+    return entry
+
+def get_version(channel):
+    """Versione indicizzata per channel ('' se non ancora nota)"""
+    entry = get(channel)
+    return entry.get('version', '') if entry else ''
+
+def _store(entries):
+    with _lock:
+        _load()
+        _index.update(entries)
+        _save()
+
+def _clean_version(tag):
+    return re.sub(r'^v[\.]*', '', tag or '', flags=re.IGNORECASE)
+
+def _entry(release, asset, feed, url=None):
+    return {
+        'version': _clean_version(release.get('tag_name')),
+        'url': url or asset.get('browser_download_url'),
+        'size': asset.get('size'),
+        'digest': asset.get('digest'),
+        'published_at': release.get('published_at', ''),
+        'feed': feed,
+        'updated': int(time.time())
+    }
+
+def _normalize_asset_url(url):
+    return url.replace('%2B', '+').strip().rstrip('/')
+
+def resolve_youtube(releases, feed):
+    """Ultimo zip official e beta (esclusi leia e unofficial) dal feed /releases"""
+    releases = releases if isinstance(releases, list) else [releases]
+    found = {}
+    for rel in releases:
+        for a in rel.get("assets", []):
+            name = a["name"].lower()
+            if not name.endswith(".zip") or "leia" in name or "unofficial" in name:
+                continue
+            channel = 'youtube_beta' if "+beta." in name else 'youtube_official'
+            if channel not in found:
+                found[channel] = _entry(rel, a, feed, _normalize_asset_url(a["browser_download_url"]))
+        if len(found) == len(YOUTUBE_CHANNELS):
+            break
+    return found
+
+def resolve_trakt(releases, feed):
+    """Ultima release stabile per data di pubblicazione: asset zip o zipball"""
+    stable = [r for r in releases if not r.get('prerelease', False)]
+    if not stable:
+        raise Exception("Nessuna release stabile disponibile")
+    latest = max(stable, key=lambda r: r.get('published_at') or '0')
+    asset = next((a for a in latest.get("assets", []) if a["name"].lower().endswith(".zip")), {})
+    # Fallback allo zipball_url se non trovato (source code snapshot)
+    url = asset.get("browser_download_url") or latest.get("zipball_url", "")
+    if not url:
+        raise Exception("Nessun URL download trovato")
+    return {'trakt': _entry(latest, asset, feed, url)}
+
+def resolve_repo(channel, release, feed):
+    """Primo asset dell'ultima release che passa il filtro del canale"""
+    spec = REPO_CHANNELS[channel]
+    asset = next((a for a in release.get('assets', []) if spec['asset'](a.get('name', ''))), None)
+    if not asset:
+        raise Exception("Nessun ZIP trovato nella release")
+    return {channel: _entry(release, asset, feed)}
+
+def youtube_feed_url():
+    base = (get_source(lambda s: 'youtube' in s.get('name', '').lower()) or {}).get('url')
+    if not base:
+        raise Exception("URL repository YouTube non trovata")
+    if 'api.github.com' not in base:
+        m = re.search(r'https?://github\.com/([^/]+/[^/]+)', base)
+        if not m:
+            raise Exception(f"URL GitHub non valido: {base}")
+        base = f"https://api.github.com/repos/{m.group(1)}/releases"
+    return base
+
+def repo_feed_url(channel):
+    spec = REPO_CHANNELS[channel]
+    url = (get_source(spec['source']) or {}).get('url')
+    if not url:
+        raise Exception(f"URL repo {channel} non trovata")
+    path = spec['path'](url)
+    return path if path.lower().startswith('http') else f"https://api.github.com/repos/{path}/releases/latest"
+
+def _group_of(channel):
+    return 'youtube' if channel in YOUTUBE_CHANNELS else channel
+
+def _feed_url(group):
+    if group == 'youtube':
+        return youtube_feed_url()
+    if group == 'trakt':
+        return TRAKT_RELEASES_URL
+    return repo_feed_url(group)
+
+def _resolve_group(group, feed, priority):
+    """Scarica il feed di un gruppo di canali e restituisce le voci risolte"""
+    data = github_api.get_json(feed, priority, timeout=15)
+    if group == 'youtube':
+        return resolve_youtube(data, feed)
+    if group == 'trakt':
+        return resolve_trakt(data, feed)
+    return resolve_repo(group, data, feed)
+
+def resolve(channel, priority=github_api.ESSENTIAL):
+    """
+    Release per channel per gli installer: dall'indice se recente, altrimenti
+    risolta dal feed GitHub (e salvata nell'indice). Se GitHub non risponde
+    vale anche una voce più vecchia; solleva un'eccezione se non c'è nulla.
+    """
+    group = _group_of(channel)
+    feed = _feed_url(group)
+    entry = get(channel, INDEX_MAX_AGE)
+    if entry and entry.get('feed') == feed:
+        return entry
+    try:
+        entries = _resolve_group(group, feed, priority)
+    except Exception as e:
+        entry = get(channel)
+        if entry is None or entry.get('feed') != feed:
+            raise
+        log(f"Risoluzione release {channel} fallita ({e}), uso l'indice", xbmc.LOGWARNING)
+        return entry
+    _store(entries)
+    if channel not in entries:
+        raise Exception(f"Nessuna release trovata per {channel}")
+    return entries[channel]
+
+def refresh(priority=github_api.BACKGROUND):
+    """Aggiorna tutti i canali (dal servizio); un canale in errore tiene la voce precedente"""
+    entries = {}
+    for group in ('youtube', 'trakt') + tuple(REPO_CHANNELS):
+        try:
+            entries.update(_resolve_group(group, _feed_url(group), priority))
+        except github_api.RateLimitDeferred as e:
+            log(f"Indice release rinviato: {e}", xbmc.LOGWARNING)
+            break
+        except Exception as e:
+            log(f"Indice release {group} non aggiornato: {e}", xbmc.LOGWARNING)
+    if entries:
+        _store(entries)
+        log("Indice release aggiornato: " +
+            ", ".join(f"{c} {e['version']}" for c, e in sorted(entries.items())))
+    return entries
@@ -2,59 +2,69 @@
 # Modulo completo per gestione repository
 # -*- coding: utf-8 -*-
 
-import json
 import re
-import urllib.request
 import xbmc
 import xbmcgui
 import traceback
 from urllib.parse import urljoin
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 from resources.lib.utils import (
-    get_source_url, 
+    get_source, 
     download_and_extract_zip, 
     log,
-    get_existing_sources,
     remove_physical_repo
 )
-from resources.lib.sources_manager import add_source_to_xml, remove_source_from_xml
+from resources.lib.sources_manager import (
+    add_source_to_xml,
+    add_sources_to_xml,
+    remove_source_from_xml,
+    remove_sources_from_xml,
+    is_source_present
+)
+from resources.lib import addon_registry
+from resources.lib import http_client
+from resources.lib import github_api
+from resources.lib import release_index
+from resources.lib.addon_registry import get_catalog_addon_id
 
-# ID repository speciali
-KODINERDS_REPO_ID = "repository.kodinerds"
-SANDMANN_REPO_ID = "repository.sandmann79.plugins"
-ELEMENTUM_REPO_ID = "repository.elementumorg"
+# Download ZIP contemporanei durante "Aggiungi Tutti"
+INSTALL_ALL_WORKERS = 4
 
 def is_repo_installed(repo):
     """Controlla se un repository è installato"""
-    name = repo.get("name", "").lower()
-    url = repo.get("url", "")
-    
-    if "kodinerds" in name:
-        return xbmc.getCondVisibility(f"System.HasAddon({KODINERDS_REPO_ID})") == 1
-    if "sandmann" in name:
-        return xbmc.getCondVisibility(f"System.HasAddon({SANDMANN_REPO_ID})") == 1
-    if "elementum" in name:
-        return xbmc.getCondVisibility(f"System.HasAddon({ELEMENTUM_REPO_ID})") == 1
-    
-    return url in get_existing_sources()
+    addon_id = get_catalog_addon_id(repo)
+    if addon_id:
+        return addon_registry.is_addon_installed(addon_id)
+
+    return is_source_present(repo.get("url", ""))
+
+def get_zip_installer(repo):
+    """
+    Restituisce l'installer dedicato (download ZIP) per un repository,
+    None se il repository è una semplice sorgente da aggiungere a sources.xml
+    """
+    lower = repo.get('name', '').lower()
+    if "kodinerds" in lower:
+        from resources.lib.kodinerds_downloader import download_latest_kodinerds_zip
+        return download_latest_kodinerds_zip
+    elif "sandmann" in lower:
+        from resources.lib.sandmann_repo_installer import download_sandmann_repo
+        return download_sandmann_repo
+    elif "elementum" in lower:
+        from resources.lib.elementum_repo_installer import download_elementum_repo
+        return download_elementum_repo
+    return None
 
 def install_repo(repo):
     """Installa un singolo repository"""
     name = repo['name']
-    lower = name.lower()
     
     try:
-        if "kodinerds" in lower:
-            from resources.lib.kodinerds_downloader import download_latest_kodinerds_zip
-            return download_latest_kodinerds_zip()
-        elif "sandmann" in lower:
-            from resources.lib.sandmann_repo_installer import download_sandmann_repo
-            return download_sandmann_repo()
-        elif "elementum" in lower:
-            from resources.lib.elementum_repo_installer import download_elementum_repo
-            return download_elementum_repo()
-        else:
-            return add_source_to_xml(repo)
+        installer = get_zip_installer(repo)
+        if installer:
+            return installer()
+        return add_source_to_xml(repo)
     except Exception as e:
         log(f"Errore install {name}: {traceback.format_exc()}", xbmc.LOGERROR)
         return False
@@ -62,45 +72,104 @@ def install_repo(repo):
 def uninstall_repo(repo):
     """Disinstalla un singolo repository"""
     name = repo['name']
-    lower = name.lower()
     
     try:
-        if "kodinerds" in lower:
-            return remove_physical_repo(KODINERDS_REPO_ID)
-        elif "sandmann" in lower:
-            return remove_physical_repo(SANDMANN_REPO_ID)
-        elif "elementum" in lower:
-            return remove_physical_repo(ELEMENTUM_REPO_ID)
-        else:
-            return remove_source_from_xml(repo)
+        addon_id = get_catalog_addon_id(repo)
+        if addon_id:
+            if remove_physical_repo(addon_id):
+                addon_registry.mark_removed(addon_id)
+                return True
+            return False
+        return remove_source_from_xml(repo)
     except Exception as e:
         log(f"Errore uninstall {name}: {traceback.format_exc()}", xbmc.LOGERROR)
         return False
 
-def install_all_repos(sources, progress_callback=None):
-    """Installa tutti i repository"""
+def install_all_repos(sources, progress_callback=None, max_workers=INSTALL_ALL_WORKERS):
+    """
+    Installa tutti i repository.
+    I repository scaricati da ZIP vengono installati in parallelo su un pool
+    di thread limitato; le sorgenti semplici vengono raccolte e scritte in
+    sources.xml con un'unica scrittura finale.
+    progress_callback(index, total, name) è chiamata dal thread chiamante e
+    interrompe l'operazione se restituisce True.
+    """
     added = skipped = 0
     total = len(sources)
-    
-    for i, repo in enumerate(sources):
-        if progress_callback and progress_callback(i, total, repo['name']):
-            break
-            
-        if is_repo_installed(repo):
-            skipped += 1
-            continue
-            
-        if install_repo(repo):
-            added += 1
-        else:
-            skipped += 1
-            
+    done = 0
+    cancelled = False
+    plain = []
+
+    def report(name):
+        nonlocal done, cancelled
+        if not cancelled and progress_callback and progress_callback(done, total, name):
+            cancelled = True
+        done += 1
+        return cancelled
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        # Avvia subito i download, poi elabora le sorgenti semplici in memoria
+        futures = {}
+        to_check = []
+        for repo in sources:
+            if is_repo_installed(repo):
+                to_check.append((repo, True))
+                continue
+            installer = get_zip_installer(repo)
+            if installer:
+                futures[pool.submit(install_repo, repo)] = repo
+            else:
+                to_check.append((repo, False))
+
+        for repo, installed in to_check:
+            if report(repo['name']):
+                break
+            if installed:
+                skipped += 1
+            else:
+                plain.append(repo)
+
+        if cancelled:
+            for future in futures:
+                future.cancel()
+
+        pending = set(futures)
+        while pending:
+            finished, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+            for future in finished:
+                if future.cancelled():
+                    continue
+                report(futures[future]['name'])
+                if future.result():
+                    added += 1
+                else:
+                    skipped += 1
+            if not finished and not cancelled and progress_callback:
+                # Nessun download terminato: controlla comunque l'annullamento
+                waiting = futures[next(iter(pending))]['name']
+                cancelled = bool(progress_callback(done, total, waiting))
+            if cancelled:
+                # I download già avviati terminano, quelli in coda no
+                for future in pending:
+                    future.cancel()
+
+    # Un'unica transazione su sources.xml per tutte le sorgenti semplici
+    if plain:
+        written = add_sources_to_xml(plain)
+        added += len(written)
+        skipped += len(plain) - len(written)
+
     return added, skipped
 
 def uninstall_all_repos(sources, progress_callback=None):
-    """Disinstalla tutti i repository"""
+    """
+    Disinstalla tutti i repository.
+    Le sorgenti semplici vengono rimosse da sources.xml con un'unica
+    transazione (una lettura e una scrittura).
+    """
     removed = errors = 0
     total = len(sources)
+    plain = []
     
     for i, repo in enumerate(sources):
         if progress_callback and progress_callback(i, total, repo['name']):
@@ -108,22 +177,34 @@ def uninstall_all_repos(sources, progress_callback=None):
             
         if not is_repo_installed(repo):
             continue
+
+        if not get_catalog_addon_id(repo):
+            plain.append(repo)
+            continue
             
         if uninstall_repo(repo):
             removed += 1
         else:
             errors += 1
+
+    if plain:
+        done = remove_sources_from_xml(plain)
+        removed += len(done)
+        errors += len(plain) - len(done)
             
     return removed, errors
 
 # Funzioni per installazione generica da GitHub/HTML
-def install_github_release(source_predicate, repo_path_extractor, asset_filter, addon_name):
+def install_github_release(source_predicate, repo_path_extractor, asset_filter, addon_name,
+                           channel=None):
     """
     - source_predicate(s: dict) -> bool
     - repo_path_extractor(url: str) -> "owner/repo" o URL API completo
     - asset_filter(name: str) -> bool
+    - channel: canale di release_index con la release già risolta (facoltativo)
     """
-    url = get_source_url(source_predicate)
+    source = get_source(source_predicate) or {}
+    url = source.get('url')
     if not url:
         msg = f"URL repo {addon_name} non trovata"
         xbmc.log(f"[{addon_name}] {msg}", xbmc.LOGERROR)
@@ -132,16 +213,24 @@ def install_github_release(source_predicate, repo_path_extractor, asset_filter,
         return False
 
     try:
-        path = repo_path_extractor(url)
-        api  = path if path.lower().startswith('http') else f"https://api.github.com/repos/{path}/releases/latest"
-        with urllib.request.urlopen(api, timeout=15) as resp:
-            data = json.loads(resp.read().decode('utf-8'))
+        if channel:
+            # Release dall'indice del servizio o, se scaduta, dal feed GitHub
+            release = release_index.resolve(channel)
+            z = {'browser_download_url': release['url'], 'size': release.get('size'),
+                 'digest': release.get('digest')}
+        else:
+            path = repo_path_extractor(url)
+            api  = path if path.lower().startswith('http') else f"https://api.github.com/repos/{path}/releases/latest"
+            data = github_api.get_json(api, github_api.ESSENTIAL, timeout=15)
 
-        assets = data.get('assets', [])
-        z = next((a for a in assets if asset_filter(a.get('name', ''))), None)
-        if not z:
-            raise Exception("Nessun ZIP trovato nella release")
-        return download_and_extract_zip(z['browser_download_url'], addon_name)
+            assets = data.get('assets', [])
+            z = next((a for a in assets if asset_filter(a.get('name', ''))), None)
+            if not z:
+                raise Exception("Nessun ZIP trovato nella release")
+        # Verifica: sha256 da addons.json oppure digest dell'asset GitHub, più la dimensione
+        return download_and_extract_zip(z['browser_download_url'], addon_name,
+                                        expected_size=z.get('size'),
+                                        expected_sha256=source.get('sha256') or z.get('digest'))
 
     except Exception as e:
         log(f"{addon_name} error: {e}", xbmc.LOGERROR)
@@ -154,7 +243,8 @@ def install_from_html(source_predicate, zip_pattern, addon_name):
     - source_predicate(s: dict) -> bool
     - zip_pattern: regex per link .zip
     """
-    base = get_source_url(source_predicate)
+    source = get_source(source_predicate) or {}
+    base = source.get('url')
     if not base:
         msg = f"URL repo {addon_name} non trovata"
         xbmc.log(f"[{addon_name}] {msg}", xbmc.LOGERROR)
@@ -163,14 +253,15 @@ def install_from_html(source_predicate, zip_pattern, addon_name):
         return False
 
     try:
-        with urllib.request.urlopen(base, timeout=15) as resp:
+        with http_client.request(base, timeout=15) as resp:
             html = resp.read().decode('utf-8')
         links = re.findall(r'href="([^"]+\.zip)"', html, re.IGNORECASE)
         matches = [l for l in links if re.search(zip_pattern, l)]
         if not matches:
             raise Exception("Nessun file ZIP corrispondente trovato")
         zip_url = urljoin(base, matches[0])
-        return download_and_extract_zip(zip_url, addon_name)
+        return download_and_extract_zip(zip_url, addon_name,
+                                        expected_sha256=source.get('sha256'))
 
     except Exception as e:
         log(f"{addon_name} HTML error: {e}", xbmc.LOGERROR)
@@ -1,47 +1,116 @@
 # -*- coding: utf-8 -*-
-import xml.dom.minidom as minidom
+# Gestione di special://profile/sources.xml
+# Le modifiche toccano solo la sezione <files>: le altre sezioni vengono
+# ricopiate byte per byte e il file viene riscritto in streaming
+# (file temporaneo + rename) senza costruire in memoria l'intero documento.
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape, quoteattr
 import xbmcvfs
 import os
 import xbmc
 import re
+import mmap
+import threading
 
-def ensure_media_sections(doc):
-    """Garantisce che tutte le sezioni media siano presenti nel documento"""
-    root = doc.documentElement
-    required_sections = ['programs', 'video', 'music', 'pictures', 'files']
-    
-    for section in required_sections:
-        # Controlla se la sezione esiste
-        sections = root.getElementsByTagName(section)
-        if not sections:
-            # Crea la sezione mancante
-            section_node = doc.createElement(section)
-            default_node = doc.createElement("default")
-            default_node.setAttribute("pathversion", "1")
-            section_node.appendChild(default_node)
-            root.appendChild(section_node)
+MEDIA_SECTIONS = ['programs', 'video', 'music', 'pictures', 'files']
+COPY_CHUNK_SIZE = 64 * 1024
+
+_FILES_SECTION_RE = re.compile(rb'<files(?:\s[^>]*?)?(?:/>|>.*?</files\s*>)', re.S)
+_SOURCES_CLOSE_RE = re.compile(rb'</sources\s*>')
+
+# Indice condiviso di sources.xml: ricostruito solo se cambiano mtime o dimensione
+_index = {'signature': None, 'urls': [], 'paths': set(), 'names': {}}
+_index_lock = threading.RLock()
+# Serializza lettura e scrittura di sources.xml tra i thread
+_write_lock = threading.RLock()
+
+def get_sources_path():
+    """Percorso reale di special://profile/sources.xml"""
+    return xbmcvfs.translatePath("special://profile/sources.xml")
+
+def normalize_source_path(path):
+    """Normalizza un path per il confronto (spazi, maiuscole, slash finale)"""
+    return (path or "").strip().rstrip('/\\').lower()
+
+def _file_signature(sources_path):
+    """Firma (mtime, dimensione) del file, None se non esiste"""
+    try:
+        st = os.stat(sources_path)
+        return (st.st_mtime, st.st_size)
+    except OSError:
+        return None
+
+def _rebuild_index(sources_path, signature):
+    """Rilegge sources.xml e ricostruisce l'indice in memoria"""
+    urls, names = [], {}
+    if signature is not None:
+        try:
+            # iterparse: ogni <source> viene liberato appena letto
+            for _, elem in ET.iterparse(sources_path):
+                if elem.tag == 'source':
+                    path = elem.findtext('path')
+                    if path:
+                        urls.append(path)
+                        names[elem.findtext('name') or ''] = path
+                    elem.clear()
+        except Exception as e:
+            xbmc.log(f"Errore lettura sources.xml: {str(e)}", xbmc.LOGERROR)
+    _index['signature'] = signature
+    _index['urls'] = urls
+    _index['paths'] = {normalize_source_path(u) for u in urls}
+    _index['names'] = names
+
+def get_sources_index():
+    """
+    Restituisce l'indice di sources.xml: 'urls' (path originali), 'paths'
+    (set di path normalizzati) e 'names' (nome -> path)
+    """
+    sources_path = get_sources_path()
+    with _index_lock:
+        signature = _file_signature(sources_path)
+        if signature != _index['signature'] or signature is None:
+            _rebuild_index(sources_path, signature)
+        return _index
+
+def is_source_present(url):
+    """Controlla se un path è già presente in sources.xml"""
+    return normalize_source_path(url) in get_sources_index()['paths']
+
+def _update_index(sources_path, previous_signature, added=None, removed=None):
+    """
+    Aggiorna l'indice dopo una scrittura fatta da questo modulo, senza rileggere
+    il file. Se l'indice non era allineato al file prima della scrittura viene
+    solo invalidato e sarà ricostruito alla prossima lettura.
+    """
+    with _index_lock:
+        if previous_signature is None or _index['signature'] != previous_signature:
+            _index['signature'] = None
+            return
+        for name, url in added or []:
+            _index['urls'].append(url)
+            _index['paths'].add(normalize_source_path(url))
+            _index['names'][name] = url
+        if removed:
+            gone = {normalize_source_path(u) for u in removed}
+            _index['urls'] = [u for u in _index['urls'] if normalize_source_path(u) not in gone]
+            _index['paths'] -= gone
+            _index['names'] = {n: u for n, u in _index['names'].items() if normalize_source_path(u) not in gone}
+        _index['signature'] = _file_signature(sources_path)
+
+def _empty_section(section):
+    return f"  <{section}>\n    <default pathversion=\"1\"></default>\n  </{section}>\n"
 
 def create_sources_file_if_missing(sources_path):
     """Crea un nuovo file sources.xml con struttura completa se non esiste"""
     if not os.path.exists(sources_path):
         try:
-            xmldoc = minidom.Document()
-            sources_node = xmldoc.createElement("sources")
-            xmldoc.appendChild(sources_node)
-            
-            # Crea tutte le sezioni necessarie
-            for media_type in ['programs', 'video', 'music', 'pictures', 'files']:
-                type_node = xmldoc.createElement(media_type)
-                default_node = xmldoc.createElement("default")
-                default_node.setAttribute("pathversion", "1")
-                type_node.appendChild(default_node)
-                sources_node.appendChild(type_node)
-            
-            # Salva il nuovo file
-            with open(sources_path, 'wb') as f:
-                pretty_xml = xmldoc.toprettyxml(indent="  ", encoding="utf-8")
-                cleaned_xml = b'\n'.join([line for line in pretty_xml.splitlines() if line.strip()])
-                f.write(cleaned_xml)
+            content = '<?xml version="1.0" encoding="utf-8"?>\n<sources>\n'
+            content += ''.join(_empty_section(section) for section in MEDIA_SECTIONS)
+            content += '</sources>\n'
+            tmp_path = sources_path + ".tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(content.encode('utf-8'))
+            os.replace(tmp_path, sources_path)
             
             xbmc.log(f"Creato nuovo file sources.xml: {sources_path}", xbmc.LOGINFO)
             return True
@@ -49,148 +118,264 @@ def create_sources_file_if_missing(sources_path):
             xbmc.log(f"Errore creazione sources.xml: {str(e)}", xbmc.LOGERROR)
     return False
 
-def get_xml_document(sources_path):
-    """Ottiene il documento XML, crea il file se mancante o corrotto"""
+def _read_files_section(sources_path):
+    """
+    Individua la sezione <files> tramite mmap e analizza solo quella.
+    Restituisce (layout, files_elem): layout contiene gli offset della sezione
+    ('start', 'end'), della chiusura di </sources> ('close') e le sezioni
+    media mancanti ('missing').
+    """
+    with open(sources_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        closes = list(_SOURCES_CLOSE_RE.finditer(mm))
+        if not closes:
+            raise ValueError("tag </sources> mancante")
+        close = closes[-1].start()
+
+        missing = [section for section in MEDIA_SECTIONS[:-1]
+                   if not re.search(rb'<' + section.encode() + rb'[\s>/]', mm)]
+
+        match = _FILES_SECTION_RE.search(mm, 0, close)
+        if match:
+            files_elem = ET.fromstring(mm[match.start():match.end()])
+            start, end = match.start(), match.end()
+        else:
+            files_elem = ET.Element('files')
+            ET.SubElement(files_elem, 'default', {'pathversion': '1'})
+            start = end = close
+            missing.append('files')
+
+    return {'start': start, 'end': end, 'close': close, 'missing': missing}, files_elem
+
+def _load_files_section(sources_path):
+    """Legge la sezione files; se il file è corrotto lo salva come .bak e lo ricrea"""
     create_sources_file_if_missing(sources_path)
-    
     try:
-        doc = minidom.parse(sources_path)
-        ensure_media_sections(doc)
-        return doc
+        return _read_files_section(sources_path)
     except Exception as e:
         xbmc.log(f"Errore parsing sources.xml, ricreo il file: {str(e)}", xbmc.LOGERROR)
-        try:
-            # Ricrea completamente il file XML
-            xmldoc = minidom.Document()
-            sources_node = xmldoc.createElement("sources")
-            xmldoc.appendChild(sources_node)
-            
-            for media_type in ['programs', 'video', 'music', 'pictures', 'files']:
-                type_node = xmldoc.createElement(media_type)
-                default_node = xmldoc.createElement("default")
-                default_node.setAttribute("pathversion", "1")
-                type_node.appendChild(default_node)
-                sources_node.appendChild(type_node)
-            
-            # Salva il nuovo file
-            with open(sources_path, 'wb') as f:
-                pretty_xml = xmldoc.toprettyxml(indent="  ", encoding="utf-8")
-                cleaned_xml = b'\n'.join([line for line in pretty_xml.splitlines() if line.strip()])
-                f.write(cleaned_xml)
-            
-            return minidom.parse(sources_path)
-        except Exception as e2:
-            xbmc.log(f"Errore grave ricreazione sources.xml: {str(e2)}", xbmc.LOGERROR)
-            return None
+        os.replace(sources_path, sources_path + ".bak")
+        create_sources_file_if_missing(sources_path)
+        return _read_files_section(sources_path)
+
+def _write_element(out, elem, level):
+    """Serializza un elemento indentato direttamente sul file di output"""
+    attrs = ''.join(f" {k}={quoteattr(v)}" for k, v in elem.attrib.items())
+    children = list(elem)
+    if children:
+        indent = "\n" + "  " * level
+        out.write(f"<{elem.tag}{attrs}>".encode('utf-8'))
+        for child in children:
+            out.write((indent + "  ").encode('utf-8'))
+            _write_element(out, child, level + 1)
+        out.write(f"{indent}</{elem.tag}>".encode('utf-8'))
+    else:
+        text = elem.text if elem.text and elem.text.strip() else ''
+        out.write(f"<{elem.tag}{attrs}>{escape(text)}</{elem.tag}>".encode('utf-8'))
 
-def save_xml(doc, sources_path):
-    """Salva l'XML formattato correttamente"""
+def _copy_range(src, out, start, end):
+    """Copia byte [start, end) dal file originale senza caricarli tutti in memoria"""
+    src.seek(start)
+    remaining = end - start
+    while remaining > 0:
+        chunk = src.read(min(COPY_CHUNK_SIZE, remaining))
+        if not chunk:
+            break
+        out.write(chunk)
+        remaining -= len(chunk)
+
+def _write_sources_file(sources_path, layout, files_elem):
+    """
+    Riscrive sources.xml sostituendo solo la sezione <files> (e aggiungendo
+    le sezioni mancanti prima di </sources>); il resto è copiato invariato.
+    """
+    tmp_path = sources_path + ".tmp"
     try:
-        # Genera XML formattato e pulito
-        pretty_xml = doc.toprettyxml(indent="  ", encoding="utf-8")
-        cleaned_xml = b'\n'.join([line for line in pretty_xml.splitlines() if line.strip()])
-        
-        # Salva il file
-        with open(sources_path, 'wb') as f:
-            f.write(cleaned_xml)
+        with open(sources_path, 'rb') as src, open(tmp_path, 'wb') as out:
+            _copy_range(src, out, 0, layout['start'])
+            if layout['start'] == layout['end']:
+                # Sezione files assente: viene aggiunta in fondo con le altre mancanti
+                _copy_range(src, out, layout['end'], layout['close'])
+                for section in layout['missing']:
+                    if section == 'files':
+                        out.write(b"  ")
+                        _write_element(out, files_elem, 1)
+                        out.write(b"\n")
+                    else:
+                        out.write(_empty_section(section).encode('utf-8'))
+            else:
+                _write_element(out, files_elem, 1)
+                _copy_range(src, out, layout['end'], layout['close'])
+                for section in layout['missing']:
+                    out.write(_empty_section(section).encode('utf-8'))
+            src.seek(layout['close'])
+            while True:
+                chunk = src.read(COPY_CHUNK_SIZE)
+                if not chunk:
+                    break
+                out.write(chunk)
+        os.replace(tmp_path, sources_path)
         return True
     except Exception as e:
         xbmc.log(f"Errore scrittura sources.xml: {str(e)}", xbmc.LOGERROR)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+
+class SourcesTransaction:
+    """
+    Modifica sources.xml in blocco: una sola lettura, aggiunte e rimozioni in
+    memoria e una sola scrittura atomica al commit.
+
+        with SourcesTransaction() as tx:
+            tx.add(repo)
+            tx.remove(other_repo)
+
+    Il file viene letto solo alla prima operazione; all'uscita dal blocco
+    senza eccezioni le modifiche vengono salvate.
+    Se nel frattempo il file è stato modificato da altri, al commit viene
+    riletto e le operazioni vengono riapplicate sulla versione aggiornata.
+    """
+
+    def __init__(self, sources_path=None):
+        self.sources_path = sources_path or get_sources_path()
+        self._layout = None
+        self._files = None
+        self._paths = {}
+        self._signature = None
+        self._operations = []
+        self._added = []
+        self._removed = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is None:
+            self.commit()
         return False
 
+    def _load(self):
+        with _write_lock:
+            self._layout, self._files = _load_files_section(self.sources_path)
+            self._signature = _file_signature(self.sources_path)
+        self._paths = {}
+        for source in self._files.findall('source'):
+            path = source.findtext('path')
+            if path:
+                self._paths.setdefault(normalize_source_path(path), source)
+
+    def _ensure_loaded(self):
+        if self._files is None:
+            self._load()
+
+    def contains(self, url):
+        """True se il path è presente (considerando le modifiche non ancora salvate)"""
+        self._ensure_loaded()
+        return normalize_source_path(url) in self._paths
+
+    def add(self, repo):
+        """Aggiunge una sorgente; False se manca l'URL o è già presente"""
+        name = repo.get("name", "Sconosciuto")
+        url = repo.get("url", "")
+        if not url:
+            xbmc.log(f"Sorgente '{name}' senza URL", xbmc.LOGWARNING)
+            return False
+        if not self._apply_add(name, url):
+            return False
+        self._operations.append(('add', name, url))
+        self._added.append((name, url))
+        return True
+
+    def remove(self, repo):
+        """Rimuove una sorgente; False se non è presente"""
+        url = repo.get("url", "")
+        if self._files is None and not os.path.exists(self.sources_path):
+            return False  # Niente da rimuovere: non creare il file
+        if not url or not self._apply_remove(url):
+            return False
+        self._operations.append(('remove', None, url))
+        self._removed.append(url)
+        return True
+
+    def _apply_add(self, name, url):
+        self._ensure_loaded()
+        norm = normalize_source_path(url)
+        if norm in self._paths:
+            return False
+        source = ET.SubElement(self._files, 'source')
+        ET.SubElement(source, 'name').text = name
+        ET.SubElement(source, 'path', {'pathversion': '1'}).text = url
+        ET.SubElement(source, 'allowsharing').text = 'true'
+        self._paths[norm] = source
+        return True
+
+    def _apply_remove(self, url):
+        self._ensure_loaded()
+        source = self._paths.pop(normalize_source_path(url), None)
+        if source is None:
+            return False
+        self._files.remove(source)
+        return True
+
+    def commit(self):
+        """Scrive le modifiche in sospeso; True se non c'era nulla da scrivere o se la scrittura riesce"""
+        if not self._operations:
+            return True
+        with _write_lock:
+            if _file_signature(self.sources_path) != self._signature:
+                # File modificato da altri: rilettura e riapplicazione delle operazioni
+                xbmc.log("sources.xml modificato durante la transazione, riapplico le modifiche", xbmc.LOGINFO)
+                operations = self._operations
+                self._load()
+                for op, name, url in operations:
+                    if op == 'add':
+                        self._apply_add(name, url)
+                    else:
+                        self._apply_remove(url)
+
+            previous_signature = self._signature
+            written = _write_sources_file(self.sources_path, self._layout, self._files)
+            if written:
+                _update_index(self.sources_path, previous_signature,
+                              added=self._added, removed=self._removed)
+            # Gli offset sono cambiati (o la scrittura è fallita): la prossima
+            # operazione rilegge il file, senza ritentare le modifiche perse
+            self._layout = self._files = None
+            self._paths = {}
+            self._operations = []
+            self._added = []
+            self._removed = []
+        return written
+
 def add_source_to_xml(repo):
     """Aggiunge una sorgente al file sources.xml nella sezione files"""
-    sources_path = xbmcvfs.translatePath("special://profile/sources.xml")
-    name = repo.get("name", "Sconosciuto")
-    url = repo.get("url", "")
-    
-    if not url:
-        xbmc.log(f"Sorgente '{name}' senza URL", xbmc.LOGWARNING)
-        return False
+    # Commit esplicito, una sola volta: niente "with" che ritenti un commit fallito
+    tx = SourcesTransaction()
+    return tx.add(repo) and tx.commit()
 
-    doc = get_xml_document(sources_path)
-    if not doc:
-        return False
-        
-    # Garantisce che tutte le sezioni siano presenti
-    ensure_media_sections(doc)
-    
-    root = doc.documentElement
-    
-    # Trova la sezione files
-    files_nodes = root.getElementsByTagName("files")
-    if not files_nodes:
-        # Crea la sezione files se mancante
-        files_node = doc.createElement("files")
-        default_node = doc.createElement("default")
-        default_node.setAttribute("pathversion", "1")
-        files_node.appendChild(default_node)
-        root.appendChild(files_node)
-    else:
-        files_node = files_nodes[0]
-
-    # Controlla se la sorgente esiste già
-    for source in files_node.getElementsByTagName("source"):
-        path_elems = source.getElementsByTagName("path")
-        if path_elems and path_elems[0].firstChild and path_elems[0].firstChild.data == url:
-            return False  # Sorgente già presente
-
-    # Crea la nuova sorgente
-    source_elem = doc.createElement("source")
-    
-    # Elemento name
-    name_elem = doc.createElement("name")
-    name_elem.appendChild(doc.createTextNode(name))
-    source_elem.appendChild(name_elem)
-    
-    # Elemento path
-    path_elem = doc.createElement("path")
-    path_elem.setAttribute("pathversion", "1")
-    path_elem.appendChild(doc.createTextNode(url))
-    source_elem.appendChild(path_elem)
-    
-    # Elemento allowsharing
-    allowsharing_elem = doc.createElement("allowsharing")
-    allowsharing_elem.appendChild(doc.createTextNode("true"))
-    source_elem.appendChild(allowsharing_elem)
-    
-    # Aggiungi la sorgente alla sezione files
-    files_node.appendChild(source_elem)
-
-    return save_xml(doc, sources_path)
+def add_sources_to_xml(repos):
+    """
+    Aggiunge più sorgenti al file sources.xml con una sola lettura e una sola
+    scrittura. Restituisce la lista delle repo effettivamente aggiunte.
+    """
+    tx = SourcesTransaction()
+    added = [repo for repo in repos if tx.add(repo)]
+    return added if added and tx.commit() else []
 
 def remove_source_from_xml(repo):
     """Rimuove una sorgente dal file sources.xml"""
-    sources_path = xbmcvfs.translatePath("special://profile/sources.xml")
-    url = repo.get("url", "")
-    
-    if not os.path.exists(sources_path) or not url:
+    if not os.path.exists(get_sources_path()) or not repo.get("url", ""):
         return False
+    tx = SourcesTransaction()
+    return tx.remove(repo) and tx.commit()
 
-    doc = get_xml_document(sources_path)
-    if not doc:
-        return False
-        
-    # Garantisce che tutte le sezioni siano presenti
-    ensure_media_sections(doc)
-    
-    root = doc.documentElement
-    files_nodes = root.getElementsByTagName("files")
-    if not files_nodes:
-        return False
-        
-    files_node = files_nodes[0]
-    removed = False
-
-    # Trova tutte le sorgenti
-    sources = files_node.getElementsByTagName("source")
-    for source in sources:
-        path_elems = source.getElementsByTagName("path")
-        if path_elems and path_elems[0].firstChild and path_elems[0].firstChild.data == url:
-            files_node.removeChild(source)
-            removed = True
-            break
-
-    if removed:
-        return save_xml(doc, sources_path)
-    return False
+def remove_sources_from_xml(repos):
+    """
+    Rimuove più sorgenti dal file sources.xml con una sola lettura e una sola
+    scrittura. Restituisce la lista delle repo effettivamente rimosse.
+    """
+    if not os.path.exists(get_sources_path()):
+        return []
+    tx = SourcesTransaction()
+    removed = [repo for repo in repos if tx.remove(repo)]
+    return removed if removed and tx.commit() else []
@@ -6,17 +6,17 @@ nella cartella 'special://profile/addon_data/trakt_install',
 e mostra la versione scaricata.
 """
 
-import json
-import urllib.request
 import xbmc
 import xbmcgui
 import xbmcaddon
 import xbmcvfs
 import os
-import re
 import traceback
-from resources.lib.utils import log
+from resources.lib.utils import get_source, log
 from resources.lib import sources_manager
+from resources.lib.downloader import download_file
+from resources.lib import release_index
+from resources.lib import github_api
 
 ADDON = xbmcaddon.Addon()
 ADDON_NAME = ADDON.getAddonInfo('name')
@@ -27,11 +27,8 @@ def install_trakt_addon():
     e mostra la versione scaricata.
     """
     try:
-        result = get_latest_trakt_url()
-        if not result:
-            raise Exception("Nessuna release Trakt trovata")
-        
-        zip_url, version = result
+        release = release_index.resolve('trakt')
+        zip_url, version = release['url'], release['version'] or "unknown"
         log(f"Trovata versione Trakt: {version}", xbmc.LOGINFO)
 
         # Percorso virtuale scelto
@@ -73,24 +70,23 @@ def install_trakt_addon():
             else:
                 return False
 
-        # Scarica ZIP
-        req = urllib.request.Request(zip_url)
-        req.add_header('User-Agent', 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)')
-        
-        with urllib.request.urlopen(req) as response:
-            if response.getcode() != 200:
-                raise Exception(f"Errore nel download: {response.getcode()}")
-            
-            # Ottieni l'URL finale dopo i redirect
-            final_url = response.geturl()
-            if final_url != zip_url:
-                log(f"Reindirizzato a: {final_url}", xbmc.LOGINFO)
-                if final_url.endswith('.zip'):
-                    zip_name = os.path.basename(final_url)
-                    dest_path = os.path.join(dest_dir, zip_name)
-            
-            with open(dest_path, 'wb') as f:
-                f.write(response.read())
+        # Scarica ZIP (a blocchi, con ripresa in caso di interruzione)
+        trakt_source = get_source(lambda s: 'trakt' in s.get('name', '').lower()) or {}
+        # Lo zipball è servito da api.github.com: la richiesta passa da budget e token
+        if github_api.is_api_url(zip_url):
+            zip_url = github_api.resolve_download_url(zip_url, github_api.ESSENTIAL)
+        final_url = download_file(zip_url, dest_path, "Trakt Addon", show_dialog=True,
+                                  expected_size=release.get('size'),
+                                  expected_sha256=trakt_source.get('sha256') or release.get('digest'))
+
+        # Ottieni l'URL finale dopo i redirect
+        if final_url != zip_url:
+            log(f"Reindirizzato a: {final_url}", xbmc.LOGINFO)
+            if final_url.endswith('.zip'):
+                zip_name = os.path.basename(final_url)
+                final_path = os.path.join(dest_dir, zip_name)
+                os.replace(dest_path, final_path)
+                dest_path = final_path
 
         # PRIMO DIALOG: Messaggio di conferma download con versione
         xbmcgui.Dialog().ok(
@@ -127,58 +123,3 @@ def install_trakt_addon():
             5000
         )
         return False
-
-
-def get_latest_trakt_url():
-    """
-    Restituisce l'URL zip e la versione dell'ultima release di Trakt
-    """
-    # URL API per le release
-    api_url = "https://api.github.com/repos/trakt/script.trakt/releases"
-    
-    try:
-        req = urllib.request.Request(api_url)
-        req.add_header('User-Agent', 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)')
-        
-        with urllib.request.urlopen(req, timeout=15) as resp:
-            if resp.getcode() != 200:
-                raise Exception(f"Errore API GitHub: {resp.getcode()}")
-            releases = json.loads(resp.read().decode('utf-8'))
-    except Exception as e:
-        raise Exception(f"Errore API GitHub: {str(e)}")
-    
-    # Filtra solo release stabili (non prerelease)
-    stable_releases = [r for r in releases if not r.get('prerelease', False)]
-    
-    if not stable_releases:
-        raise Exception("Nessuna release stabile disponibile")
-    
-    # Ordina per data di pubblicazione (più recente prima)
-    stable_releases.sort(
-        key=lambda r: r.get('published_at', '0'), 
-        reverse=True
-    )
-    
-    # Cerca nella release più recente un asset ZIP valido
-    latest_release = stable_releases[0]
-    version = latest_release.get("tag_name", "unknown")
-    
-    # Pulisci la versione
-    version = re.sub(r'^v[\.]*', '', version, flags=re.IGNORECASE)
-    
-    # Cerca un asset ZIP
-    zip_url = None
-    for asset in latest_release.get("assets", []):
-        name = asset["name"].lower()
-        if name.endswith(".zip"):
-            zip_url = asset["browser_download_url"]
-            break
-    
-    # Fallback allo zipball_url se non trovato (source code snapshot)
-    if not zip_url:
-        zip_url = latest_release.get("zipball_url", "")
-    
-    if not zip_url:
-        raise Exception("Nessun URL download trovato")
-    
-    return (zip_url, version)
\ No newline at end of file
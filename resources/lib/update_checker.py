@@ -1,16 +1,41 @@
 # -*- coding: utf-8 -*-
 import os
 import shutil
-import urllib.request
 import urllib.error
 import xbmc
 import xbmcgui
 import traceback
-from .utils import log, safe_download_file
+import json
+from .utils import log, store_catalog, touch_catalog, get_catalog_etag, register_local_files
+from . import http_client
+
+def _read_last_etag(last_etag_file):
+    """Legge l'ETag salvato, rimettendo le virgolette tolte dalle versioni precedenti."""
+    if not os.path.exists(last_etag_file):
+        return ""
+    with open(last_etag_file, 'r') as f:
+        etag = f.read().strip()
+    if etag and not etag.startswith(('"', 'W/')):
+        etag = f'"{etag}"'
+    return etag
+
+def _fill_catalog_from_local(local_json, etag, last_modified=""):
+    """Dopo un 304 rende disponibile alla GUI il catalogo già salvato su disco."""
+    if get_catalog_etag() == etag:
+        touch_catalog()
+        return
+    try:
+        with open(local_json, 'r', encoding='utf-8') as f:
+            store_catalog(json.load(f), etag, last_modified)
+    except Exception as e:
+        log(f"Errore lettura {local_json}: {e}", xbmc.LOGERROR)
 
 def check_for_updates(ADDON_NAME, ADDON_ICON, LOCAL_JSON, BACKUP_JSON, LAST_ETAG_FILE, REMOTE_URL):
     """
-    Controlla gli aggiornamenti disponibili per i repository
+    Controlla gli aggiornamenti disponibili per i repository con una sola
+    richiesta GET condizionale (If-None-Match con l'ultimo ETag salvato).
+    Il JSON scaricato viene salvato in LOCAL_JSON e caricato nel catalogo
+    in memoria letto dalla GUI.
     
     Args:
         ADDON_NAME (str): Nome dell'addon
@@ -24,48 +49,55 @@ def check_for_updates(ADDON_NAME, ADDON_ICON, LOCAL_JSON, BACKUP_JSON, LAST_ETAG
         bool: True se sono stati trovati aggiornamenti, False altrimenti
     """
     try:
-        # Se non esiste il file locale, scaricalo comunque
-        if not os.path.exists(LOCAL_JSON):
-            if safe_download_file(REMOTE_URL, LOCAL_JSON):
-                return True
+        # ETag salvato: usato solo se il file locale esiste davvero
+        last_etag = _read_last_etag(LAST_ETAG_FILE) if os.path.exists(LOCAL_JSON) else ""
+
+        # Unica richiesta condizionale: 304 se addons.json non è cambiato
+        headers = {'If-None-Match': last_etag} if last_etag else {}
+        try:
+            response = http_client.request(REMOTE_URL, headers=headers, timeout=10)
+        except urllib.error.HTTPError as e:
+            if e.code != 304:
+                raise
+            log("addons.json invariato (304)")
+            register_local_files(BACKUP_JSON, LAST_ETAG_FILE)
+            _fill_catalog_from_local(LOCAL_JSON, last_etag, e.headers.get('Last-Modified', ''))
             return False
-            
+
+        with response:
+            if response.getcode() != 200:
+                return False
+            content = response.read()
+            current_etag = response.headers.get('ETag', '').strip()
+            last_modified = response.headers.get('Last-Modified', '')
+        data = json.loads(content.decode('utf-8'))
+
         # Crea backup se non esiste
         if os.path.exists(LOCAL_JSON) and not os.path.exists(BACKUP_JSON):
             shutil.copy(LOCAL_JSON, BACKUP_JSON)
-            
-        # Controlla ETag per aggiornamenti
-        req = urllib.request.Request(REMOTE_URL, method='HEAD')
-        response = urllib.request.urlopen(req, timeout=10)
-        current_etag = response.headers.get('ETag', '').strip('"')
-        last_etag = ""
-        
-        if os.path.exists(LAST_ETAG_FILE):
-            with open(LAST_ETAG_FILE, 'r') as f:
-                last_etag = f.read().strip()
-                
-        # Se non c'è ETag salvato, scarica comunque
-        if not last_etag:
-            if safe_download_file(REMOTE_URL, LOCAL_JSON):
-                with open(LAST_ETAG_FILE, 'w') as f:
-                    f.write(current_etag)
-                return True
-            return False
-            
-        # Se ETag è cambiato, scarica nuovo file
-        if current_etag and current_etag != last_etag:
-            if safe_download_file(REMOTE_URL, LOCAL_JSON):
-                with open(LAST_ETAG_FILE, 'w') as f:
-                    f.write(current_etag)
-                xbmcgui.Dialog().notification(
-                    ADDON_NAME,
-                    "Nuovi repository disponibili!",
-                    ADDON_ICON,
-                    5000
-                )
-                return True
-        return False
-        
+
+        tmp = LOCAL_JSON + ".tmp"
+        with open(tmp, 'wb') as f:
+            f.write(content)
+        os.replace(tmp, LOCAL_JSON)
+        with open(LAST_ETAG_FILE, 'w') as f:
+            f.write(current_etag)
+        # Backup ed ETag restano anche dopo un aggiornamento dell'addon
+        register_local_files(BACKUP_JSON, LAST_ETAG_FILE)
+
+        # La GUI legge il catalogo appena scaricato senza un'altra richiesta
+        store_catalog(data, current_etag, last_modified)
+
+        # Notifica solo se c'era già una versione precedente
+        if last_etag and current_etag != last_etag:
+            xbmcgui.Dialog().notification(
+                ADDON_NAME,
+                "Nuovi repository disponibili!",
+                ADDON_ICON,
+                5000
+            )
+        return True
+
     except urllib.error.HTTPError as e:
         error_msg = f"Errore HTTP {e.code}: {e.reason}"
         log(f"Controllo aggiornamenti fallito: {error_msg}", xbmc.LOGERROR)
@@ -7,33 +7,189 @@ import xbmcaddon
 import xbmcvfs
 import json
 import os
-import urllib.request
+import urllib.error
 import shutil
+import threading
+import time
 import zipfile
-import xml.etree.ElementTree as ET
+from . import addon_registry
+from . import http_client
+from .job_queue import check_cancelled
+from .downloader import download_file
 
 ADDON    = xbmcaddon.Addon()
 ADDON_ID = ADDON.getAddonInfo('id')
 ADDON_PATH = xbmcvfs.translatePath(ADDON.getAddonInfo('path'))
+PROFILE_PATH = xbmcvfs.translatePath(ADDON.getAddonInfo('profile'))
 LOCAL_JSON = os.path.join(ADDON_PATH, 'resources', 'addons.json')
+CATALOG_CACHE_FILE = os.path.join(PROFILE_PATH, 'catalog_cache.json')
+# File creati dall'addon nella propria cartella (path relativi), annotati da chi li scrive
+LOCAL_FILES_FILE = os.path.join(PROFILE_PATH, 'local_files.json')
+DEFAULT_CATALOG_TTL = 60  # minuti
 
-def fetch_addons_json():
-    """1) Scarica o legge il JSON completo di addons.json."""
+# Cache del catalogo condivisa da tutto il processo (GUI, installer, service)
+_catalog = {}
+_catalog_lock = threading.RLock()
+
+def get_remote_json_url():
+    """URL raw di addons.json costruito dalle impostazioni GitHub."""
     github_user   = ADDON.getSetting("github_user").strip() or "aandroide"
     github_repo   = ADDON.getSetting("github_repo").strip() or "lista"
     github_branch = ADDON.getSetting("github_branch").strip() or "master"
-    remote_url = f"https://raw.githubusercontent.com/{github_user}/{github_repo}/{github_branch}/resources/addons.json"
+    return f"https://raw.githubusercontent.com/{github_user}/{github_repo}/{github_branch}/resources/addons.json"
 
-    xbmc.log(f"[Utils] Fetch JSON: {remote_url}", xbmc.LOGINFO)
-    data = {}
+def get_catalog_ttl():
+    """Durata (in secondi) per cui il catalogo in cache è considerato fresco."""
+    try:
+        minutes = int(ADDON.getSetting("catalog_ttl") or DEFAULT_CATALOG_TTL)
+    except ValueError:
+        minutes = DEFAULT_CATALOG_TTL
+    return max(0, minutes) * 60
+
+def load_json_state(path, default=None):
+    """Stato JSON salvato su disco; default se il file manca o non è leggibile."""
+    if not os.path.exists(path):
+        return default
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        xbmc.log(f"[Utils] Errore lettura {path}: {e}", xbmc.LOGWARNING)
+        return default
+
+def save_json_state(path, data):
+    """Salva data come JSON in modo atomico (tmp + rename). True se riuscito."""
+    tmp = path + ".tmp"
     try:
-        with urllib.request.urlopen(remote_url, timeout=10) as resp:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+        return True
+    except Exception as e:
+        xbmc.log(f"[Utils] Errore scrittura {path}: {e}", xbmc.LOGERROR)
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return False
+
+def load_local_files():
+    """Path (relativi alla cartella dell'addon) dei file creati dall'addon stesso"""
+    files = load_json_state(LOCAL_FILES_FILE, [])
+    return files if isinstance(files, list) else []
+
+def register_local_files(*paths):
+    """
+    Annota i file esistenti in paths, creati dall'addon nella propria cartella:
+    l'aggiornamento a staging li riporta nella nuova versione.
+    """
+    files = load_local_files()
+    new = [rel_path for rel_path in (os.path.relpath(p, ADDON_PATH).replace(os.sep, '/')
+                                     for p in paths if os.path.exists(p))
+           if rel_path not in files]
+    if new:
+        save_json_state(LOCAL_FILES_FILE, files + new)
+
+def _load_catalog_cache():
+    """Carica in memoria la cache su disco, se presente."""
+    if _catalog:
+        return
+    cached = load_json_state(CATALOG_CACHE_FILE, {})
+    if isinstance(cached, dict) and isinstance(cached.get('data'), dict):
+        _catalog.update(cached)
+
+def _save_catalog_cache():
+    """Salva la cache del catalogo nel profilo dell'addon."""
+    save_json_state(CATALOG_CACHE_FILE, _catalog)
+
+def store_catalog(data, etag="", last_modified=""):
+    """Aggiorna la cache del catalogo (memoria + disco) con un JSON appena scaricato."""
+    with _catalog_lock:
+        _catalog.clear()
+        _catalog.update({
+            'url': get_remote_json_url(),
+            'data': data,
+            'etag': etag or "",
+            'last_modified': last_modified or "",
+            'fetched_at': time.time()
+        })
+        _save_catalog_cache()
+
+def touch_catalog():
+    """Segna come fresco il catalogo in cache (es. dopo una risposta 304)."""
+    with _catalog_lock:
+        _load_catalog_cache()
+        if _catalog:
+            _catalog['fetched_at'] = time.time()
+            _save_catalog_cache()
+
+def get_catalog_etag():
+    """ETag del catalogo in cache per l'URL remoto corrente ('' se assente)."""
+    with _catalog_lock:
+        _load_catalog_cache()
+        if _catalog.get('url') != get_remote_json_url():
+            return ""
+        return _catalog.get('etag', "")
+
+def is_catalog_fresh():
+    """True se il catalogo in cache è ancora entro il TTL."""
+    with _catalog_lock:
+        _load_catalog_cache()
+        if not _catalog:
+            return False
+        return time.time() - _catalog.get('fetched_at', 0) < get_catalog_ttl()
+
+def _revalidate_catalog(remote_url):
+    """
+    Richiesta condizionale (If-None-Match/If-Modified-Since) del JSON remoto.
+    Restituisce True se al termine la cache contiene un catalogo valido.
+    """
+    headers = {}
+    if _catalog.get('etag'):
+        headers['If-None-Match'] = _catalog['etag']
+    if _catalog.get('last_modified'):
+        headers['If-Modified-Since'] = _catalog['last_modified']
+    try:
+        with http_client.request(remote_url, headers=headers, timeout=10) as resp:
             if resp.getcode() == 200:
                 data = json.loads(resp.read().decode('utf-8'))
+                store_catalog(data, resp.headers.get('ETag', ''), resp.headers.get('Last-Modified', ''))
+                return True
+    except urllib.error.HTTPError as e:
+        if e.code == 304 and _catalog:
+            xbmc.log("[Utils] Catalogo invariato (304)", xbmc.LOGINFO)
+            touch_catalog()
+            return True
+        xbmc.log(f"[Utils] Errore JSON remoto: {e}", xbmc.LOGERROR)
     except Exception as e:
         xbmc.log(f"[Utils] Errore JSON remoto: {e}", xbmc.LOGERROR)
+    return False
+
+def fetch_addons_json(force=False):
+    """
+    1) Restituisce il JSON completo di addons.json.
+    Finché la cache è entro il TTL non fa richieste di rete, poi la rivalida
+    con una richiesta condizionale; se GitHub non risponde usa la cache
+    scaduta o, in mancanza, il file locale.
+    """
+    remote_url = get_remote_json_url()
+    with _catalog_lock:
+        _load_catalog_cache()
+        if _catalog and _catalog.get('url') != remote_url:
+            # Impostazioni GitHub cambiate: la cache si riferisce a un altro JSON
+            _catalog.clear()
+        if not force and is_catalog_fresh():
+            return _catalog['data']
+
+        xbmc.log(f"[Utils] Fetch JSON: {remote_url}", xbmc.LOGINFO)
+        if _revalidate_catalog(remote_url):
+            return _catalog['data']
 
-    if not data and xbmcvfs.exists(LOCAL_JSON):
+        if _catalog:
+            xbmc.log("[Utils] Uso il catalogo in cache (scaduto)", xbmc.LOGWARNING)
+            return _catalog['data']
+
+    data = {}
+    if xbmcvfs.exists(LOCAL_JSON):
         try:
             with open(LOCAL_JSON, 'r', encoding='utf-8') as f:
                 data = json.load(f)
@@ -63,10 +219,12 @@ def set_addon_enabled(addon_id):
     resp = xbmc.executeJSONRPC(json.dumps(req))
     xbmc.log(f"[Utils] Abilita {addon_id}: {resp}", xbmc.LOGINFO)
 
-def download_and_extract_zip(zip_url, addon_name=""):
+def download_and_extract_zip(zip_url, addon_name="", expected_size=None, expected_sha256=None):
     """
     Scarica un .zip, lo estrae in special://home/addons/,
     abilita l’addon e notifica l’utente.
+    expected_size/expected_sha256 (facoltativi) vengono verificati durante
+    il download: un file troncato o corrotto non arriva all'estrazione.
     """
     try:
         zip_name   = os.path.basename(zip_url)
@@ -75,18 +233,26 @@ def download_and_extract_zip(zip_url, addon_name=""):
         extract_to = xbmcvfs.translatePath("special://home/addons/")
 
         xbmc.log(f"[Utils] Scarica ZIP: {zip_url}", xbmc.LOGINFO)
-        urllib.request.urlretrieve(zip_url, dest)
-        with zipfile.ZipFile(dest, 'r') as z:
-            top = z.namelist()[0].split('/')[0]
-            z.extractall(extract_to)
+        download_file(zip_url, dest, addon_name or zip_name,
+                      expected_size=expected_size, expected_sha256=expected_sha256)
+        try:
+            check_cancelled()
+            with zipfile.ZipFile(dest, 'r') as z:
+                top = z.namelist()[0].split('/')[0]
+                z.extractall(extract_to)
+        finally:
+            # Anche su errore o annullamento (JobCancelled) lo ZIP non resta in packages/
+            if os.path.exists(dest):
+                os.remove(dest)
 
         addon_id = top
         xbmc.executebuiltin('UpdateLocalAddons')
         xbmc.sleep(500)
-        if xbmc.getCondVisibility(f"System.HasAddon({addon_id})"):
-            set_addon_enabled(addon_id)
+        info = addon_registry.refresh().get(addon_id)
+        if info is not None:
+            if not info.get('enabled', True):
+                set_addon_enabled(addon_id)
             xbmc.executebuiltin('UpdateLocalAddons')
-        os.remove(dest)
         xbmcgui.Dialog().notification(addon_name or addon_id, "Installazione completata",
                                     xbmcgui.NOTIFICATION_INFO, 3000)
         return True
@@ -100,39 +266,6 @@ def log(message, level=xbmc.LOGINFO):
     """Wrapper per il log con prefisso addon."""
     xbmc.log(f"[{ADDON_ID}] {message}", level)
 
-def safe_download_file(url, dest):
-    """Scarica file in modo 'sicuro', usando tmp + rename."""
-    try:
-        with urllib.request.urlopen(url, timeout=10) as r:
-            if r.getcode() == 200:
-                tmp = dest + ".tmp"
-                with open(tmp, 'wb') as f:
-                    shutil.copyfileobj(r, f)
-                if os.path.exists(dest): os.remove(dest)
-                os.rename(tmp, dest)
-                return True
-    except Exception as e:
-        log(f"Errore download: {e}", xbmc.LOGERROR)
-    return False
-
-def get_existing_sources():
-    """Legge i path già presenti in special://profile/sources.xml."""
-    path = xbmcvfs.translatePath("special://profile/sources.xml")
-    if not os.path.exists(path):
-        return []
-    try:
-        tree = ET.parse(path)
-        root = tree.getroot()
-        urls = []
-        for src in root.findall('.//source'):
-            p = src.find('path')
-            if p is not None and p.text:
-                urls.append(p.text)
-        return urls
-    except Exception as e:
-        log(f"Errore sources.xml: {e}", xbmc.LOGERROR)
-        return []
-
 def remove_physical_repo(repo_id):
     """Rimuove fisicamente la cartella di un repo in addons/."""
     addons = xbmcvfs.translatePath("special://home/addons/")
@@ -144,30 +277,4 @@ def remove_physical_repo(repo_id):
             return True
         except Exception as e:
             log(f"Errore rimozione: {e}", xbmc.LOGERROR)
-    return False
-
-def remove_source_from_xml(repo):
-    sources_path = xbmcvfs.translatePath("special://profile/sources.xml")
-    url = repo.get("url","")
-    if not os.path.exists(sources_path) or not url:
-        return False
-    try:
-        tree = ET.parse(sources_path)
-        root = tree.getroot()
-        files = root.find("files")
-        if files is None:
-            return False
-        removed = False
-        for s in files.findall("source"):
-            p = s.find("path")
-            if p is not None and p.text == url:
-                files.remove(s)
-                removed = True
-                break
-        if removed:
-            tree.write(sources_path, encoding='utf-8', xml_declaration=True)
-            return True
-        return False
-    except Exception as e:
-        log(f"Errore rimozione sources.xml: {e}", xbmc.LOGERROR)
-        return False
\ No newline at end of file
+    return False
\ No newline at end of file
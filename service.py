@@ -3,7 +3,7 @@ import xbmcaddon
 import xbmcgui
 import xbmcvfs
 import os
-from resources.lib import github_sync, install_manager
+from resources.lib import github_sync, github_api, http_client, install_manager, release_index
 
 ADDON = xbmcaddon.Addon()
 ADDON_ID = ADDON.getAddonInfo('id')
@@ -15,19 +15,36 @@ ICON_PATH = xbmcvfs.translatePath(
 def log_info(msg):
     xbmc.log(f"[{ADDON_ID}] {msg}", xbmc.LOGINFO)
 
-def main():
-    """Controllo aggiornamenti solo all'avvio"""
-    # Controlla aggiornamenti all'avvio
+def sync_addon():
+    """Aggiorna l'addon all'ultimo commit del ramo configurato"""
     last_commit = github_sync.read_last_commit()
     remote_commit = github_sync.get_remote_commit()
-    
+    skipped_commit = github_sync.read_skipped_commit()
+
+    if remote_commit and remote_commit == skipped_commit:
+        # Versione annullata dall'utente con il ripristino: si attende un commit più recente
+        log_info(f"Commit {remote_commit[:7]} escluso dopo il ripristino, nessun aggiornamento")
+        return
+
     if remote_commit and remote_commit != last_commit:
         log_info(f"Trovato nuovo commit: {remote_commit[:7]}")
         
-        remote_files = github_sync.get_remote_file_list()
-        if remote_files:
-            github_sync.sync_all(remote_files)
+        # Solo i file cambiati dall'ultimo commit noto; sync completa se non è possibile
+        changes = None
+        if last_commit and github_sync.has_manifest():
+            changes = github_sync.get_changed_files(last_commit, remote_commit)
+        if changes is not None:
+            log_info(f"Aggiornamento incrementale: {len(changes['changed'])} file modificati, "
+                     f"{len(changes['removed'])} rimossi")
+            synced = github_sync.sync_changes(changes, remote_commit)
+        else:
+            remote_tree = github_sync.get_remote_tree(remote_commit)
+            synced = bool(remote_tree) and github_sync.sync_all(remote_tree, ref=remote_commit)
+
+        if synced:
             github_sync.write_last_commit(remote_commit)
+            if skipped_commit:
+                github_sync.write_skipped_commit('')
             
             # Notifica utente
             xbmcgui.Dialog().notification(
@@ -37,8 +54,53 @@ def main():
                 3000
             )
     
+    elif remote_commit:
+        # Nessun nuovo commit: ripara i file installati alterati o mancanti
+        repaired = github_sync.repair_local_files()
+        if repaired:
+            log_info(f"Riparati {len(repaired)} file")
+
+def report_github_limit():
+    """Controllo all'avvio del limite effettivo delle API GitHub (60 o 5000 richieste/ora)"""
+    budget = github_api.check_rate_limit()
+    if budget.get('token_rejected'):
+        xbmcgui.Dialog().notification(
+            ADDON_NAME,
+            "Token GitHub non valido: uso le API senza autenticazione",
+            xbmcgui.NOTIFICATION_WARNING,
+            5000
+        )
+
+def main():
+    """Controllo aggiornamenti solo all'avvio"""
+    # Cartella dell'addon lasciata fuori posto da un aggiornamento interrotto
+    github_sync.restore_addon_path()
+    report_github_limit()
+    delay = github_api.seconds_until_available(github_api.BACKGROUND)
+    if delay:
+        # Budget GitHub esaurito: pulizia subito, aggiornamento rinviato al reset
+        install_manager.cleanup_temp_install_folders()
+        log_info(f"Limite richieste GitHub raggiunto, aggiornamento rinviato di {delay // 60 + 1} minuti")
+        # Nessuna connessione inattiva aperta durante l'attesa
+        http_client.close_all()
+        if xbmc.Monitor().waitForAbort(delay):
+            return
+        sync_addon()
+        release_index.refresh()
+        return
+
+    # Controlla aggiornamenti all'avvio
+    sync_addon()
+
+    # Release YouTube/Trakt/Sandmann/Elementum pronte per la GUI
+    release_index.refresh()
+    
     # Esegue pulizia all'avvio
     install_manager.cleanup_temp_install_folders()
 
 if __name__ == "__main__":
-    main()
+    try:
+        main()
+    finally:
+        # Chiude le connessioni persistenti rimaste nel pool
+        http_client.close_all()